@@ -3,95 +3,101 @@ Enhanced Clause Extraction Module using Gemini API
 Identifies and categorizes specific legal clauses in documents
 """
 
+import asyncio
 import logging
+import re
+from functools import lru_cache
+from types import MappingProxyType
 from typing import Dict, Any, List, Optional, Tuple
 import json
 import google.generativeai as genai
 from .config import Config
+from .clients import get_models, run_coroutine
+from .utils import chunk_text
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:
+    import jiter
+except ImportError:
+    jiter = None
 
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class GeminiClauseExtractor:
-    """Legal clause extraction and highlighting using Google Gemini API"""
-    
-    def __init__(self):
-        self.config = Config()
-        genai.configure(api_key=self.config.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel(self.config.GEMINI_MODEL)
-        self.flash_model = genai.GenerativeModel(self.config.GEMINI_FLASH_MODEL)
-        
-        # Define common legal clause types
-        self.clause_types = {
-            'TERMINATION': 'Clauses related to contract termination, expiry, or cancellation',
-            'PAYMENT': 'Payment terms, fees, invoicing, and financial obligations',
-            'INDEMNIFICATION': 'Indemnity, liability, and hold harmless provisions',
-            'CONFIDENTIALITY': 'Non-disclosure and confidentiality requirements',
-            'INTELLECTUAL_PROPERTY': 'IP rights, ownership, and licensing terms',
-            'FORCE_MAJEURE': 'Force majeure and unforeseeable circumstances',
-            'GOVERNING_LAW': 'Jurisdiction, governing law, and dispute resolution',
-            'WARRANTIES': 'Warranties, representations, and guarantees',
-            'LIMITATION_LIABILITY': 'Liability limitations and damage caps',
-            'ASSIGNMENT': 'Assignment and transfer of rights provisions',
-            'AMENDMENT': 'Contract modification and amendment procedures',
-            'DELIVERY': 'Delivery terms, timelines, and performance obligations'
-        }
-    
-    def extract_clauses(self, text: str, clause_types: List[str] = None) -> Dict[str, Any]:
-        """
-        Extract and categorize legal clauses from document text
-        
-        Args:
-            text: The document text to analyze
-            clause_types: Specific clause types to look for (default: all)
-            
-        Returns:
-            Dictionary containing extracted clauses with positions
-        """
-        try:
-            if clause_types is None:
-                clause_types = list(self.clause_types.keys())
-            
-            prompt = self._build_clause_extraction_prompt(text, clause_types)
-            response = self.model.generate_content(prompt)
-            
-            # Parse the response
-            extracted_clauses = self._parse_clause_response(response.text)
-            
-            # Add metadata
-            clause_data = {
-                'clauses': extracted_clauses,
-                'total_clauses_found': len(extracted_clauses),
-                'clause_types_searched': clause_types,
-                'document_length': len(text)
-            }
-            
-            logger.info(f"Successfully extracted {clause_data['total_clauses_found']} clauses")
-            return clause_data
-            
-        except Exception as e:
-            logger.error(f"Clause extraction failed: {e}")
-            return {
-                'clauses': [],
-                'total_clauses_found': 0,
-                'clause_types_searched': clause_types or [],
-                'document_length': len(text)
-            }
-    
-    def _build_clause_extraction_prompt(self, text: str, clause_types: List[str]) -> str:
-        """Build the prompt for clause extraction"""
-        
-        clause_descriptions = []
-        for clause_type in clause_types:
-            description = self.clause_types.get(clause_type, f"Clauses related to {clause_type}")
-            clause_descriptions.append(f"- {clause_type}: {description}")
-        
-        prompt = f"""
+# Common legal clause types
+_CLAUSE_TYPES = MappingProxyType({
+    'TERMINATION': 'Clauses related to contract termination, expiry, or cancellation',
+    'PAYMENT': 'Payment terms, fees, invoicing, and financial obligations',
+    'INDEMNIFICATION': 'Indemnity, liability, and hold harmless provisions',
+    'CONFIDENTIALITY': 'Non-disclosure and confidentiality requirements',
+    'INTELLECTUAL_PROPERTY': 'IP rights, ownership, and licensing terms',
+    'FORCE_MAJEURE': 'Force majeure and unforeseeable circumstances',
+    'GOVERNING_LAW': 'Jurisdiction, governing law, and dispute resolution',
+    'WARRANTIES': 'Warranties, representations, and guarantees',
+    'LIMITATION_LIABILITY': 'Liability limitations and damage caps',
+    'ASSIGNMENT': 'Assignment and transfer of rights provisions',
+    'AMENDMENT': 'Contract modification and amendment procedures',
+    'DELIVERY': 'Delivery terms, timelines, and performance obligations'
+})
+
+# Fallback parser patterns: any clause type name, and the field labels that are not clause text
+_CLAUSE_TYPE_RE = re.compile('|'.join(re.escape(clause_type) for clause_type in _CLAUSE_TYPES), re.IGNORECASE)
+_FIELD_LABEL_RE = re.compile(r'type:|context:|importance:', re.IGNORECASE)
+
+_IMPORTANCE_LEVELS = ('HIGH', 'MEDIUM', 'LOW')
+
+# Field defaults for parsed clauses; the response schema normally supplies every field
+_CLAUSE_DEFAULTS = MappingProxyType({
+    'clause_type': '',
+    'clause_text': '',
+    'context': '',
+    'importance': 'MEDIUM',
+    'section': 'Unknown'
+})
+
+# Color coding for different clause types
+_COLOR_MAP = MappingProxyType({
+    'TERMINATION': '#ffcccc',      # Light red
+    'PAYMENT': '#ccffcc',          # Light green
+    'INDEMNIFICATION': '#ffcc99',  # Light orange
+    'CONFIDENTIALITY': '#ccccff',  # Light blue
+    'INTELLECTUAL_PROPERTY': '#ffccff', # Light purple
+    'FORCE_MAJEURE': '#ffffcc',    # Light yellow
+    'GOVERNING_LAW': '#ccffff',    # Light cyan
+    'WARRANTIES': '#f0ccff',       # Light magenta
+    'LIMITATION_LIABILITY': '#ffccdd', # Light pink
+    'ASSIGNMENT': '#ccffdd',       # Light mint
+    'AMENDMENT': '#ddccff',        # Light lavender
+    'DELIVERY': '#ddffcc'          # Light lime
+})
+
+# Highlight span per clause type, so only the context and clause text are formatted per clause
+_SPAN_TEMPLATE = '<span style="background-color: {color}; padding: 2px; border-left: 3px solid #333; margin: 2px;" title="{clause_type}: {{ctx}}">{{txt}}</span>'
+_SPAN_TEMPLATES = MappingProxyType({
+    clause_type: _SPAN_TEMPLATE.format(color=color, clause_type=clause_type)
+    for clause_type, color in _COLOR_MAP.items()
+})
+
+# Static prompt text around the document; the tail only varies with the requested clause types
+_CLAUSE_PROMPT_HEAD = """
         You are a legal expert analyzing a contract. Extract specific legal clauses from this document and provide their exact text with context.
 
         Document text:
-        {text}
+        """
+
+@lru_cache(maxsize=32)
+def _clause_prompt_tail(clause_types: Tuple[str, ...]) -> str:
+    """Build the clause list and output instructions that follow the document text"""
+    clause_descriptions = [
+        f"- {clause_type}: {_CLAUSE_TYPES.get(clause_type, f'Clauses related to {clause_type}')}"
+        for clause_type in clause_types
+    ]
+    
+    return f"""
 
         Extract the following types of clauses:
         {chr(10).join(clause_descriptions)}
@@ -125,43 +131,335 @@ class GeminiClauseExtractor:
             }}
         ]
         """
+
+def _loads_json(json_str: str) -> Any:
+    """Parse JSON with jiter when available, reusing interned keys across clauses"""
+    if jiter is not None:
+        return jiter.from_json(json_str.encode('utf-8'), cache_mode="keys")
+    return json.loads(json_str)
+
+class GeminiClauseExtractor:
+    """Legal clause extraction and highlighting using Google Gemini API"""
+    
+    def __init__(self):
+        self.config = Config()
+        self.model, self.flash_model = get_models()
         
-        return prompt
+        # Define common legal clause types
+        self.clause_types = _CLAUSE_TYPES
+    
+    def extract_clauses(self, text: str, clause_types: List[str] = None, tier: str = 'flash',
+                        cached_model=None) -> Dict[str, Any]:
+        """
+        Extract and categorize legal clauses from document text
+        
+        Args:
+            text: The document text to analyze
+            clause_types: Specific clause types to look for (default: all)
+            tier: 'flash' extracts with the flash model and re-reviews HIGH clauses with pro;
+                'pro' runs the whole extraction on the pro model
+            cached_model: Optional pro model bound to a context cache holding the document;
+                replaces both the tier model and the chunked path
+            
+        Returns:
+            Dictionary containing extracted clauses with positions
+        """
+        try:
+            if clause_types is None:
+                clause_types = list(self.clause_types.keys())
+            
+            if cached_model is None and len(text) > self.config.MAX_PROMPT_CHARS:
+                # On the shared loop: the async client cannot be used from a fresh asyncio.run loop
+                return run_coroutine(self._extract_clauses_chunked_async(text, clause_types, tier))
+            
+            if cached_model is not None:
+                prompt = self._build_clause_extraction_prompt(self.config.CACHED_DOCUMENT_PLACEHOLDER, clause_types)
+                model = cached_model
+            else:
+                prompt = self._build_clause_extraction_prompt(text, clause_types)
+                model = self._tier_model(tier)
+            
+            # Stream the reply and stop reading as soon as the JSON array is complete
+            chunks = []
+            for chunk in model.generate_content(
+                prompt, generation_config=self._clause_generation_config(), stream=True
+            ):
+                chunks.append(chunk.text)
+                if ']' in chunk.text and self._is_complete_json_array(''.join(chunks)):
+                    break
+            
+            clause_data = self._build_clause_data(''.join(chunks), clause_types, text)
+            if tier == 'flash' and cached_model is None:
+                clause_data['clauses'] = self.review_high_importance_clauses(clause_data['clauses'])
+            
+            logger.info("Successfully extracted %s clauses", clause_data['total_clauses_found'])
+            return clause_data
+            
+        except Exception as e:
+            logger.error(f"Clause extraction failed: {e}")
+            return self._empty_clause_data(clause_types, text)
+    
+    async def extract_clauses_async(self, text: str, clause_types: List[str] = None, tier: str = 'flash') -> Dict[str, Any]:
+        """
+        Extract legal clauses without blocking the event loop
+        
+        Args:
+            text: The document text to analyze
+            clause_types: Specific clause types to look for (default: all)
+            tier: Model tier for extraction ('flash' or 'pro')
+            
+        Returns:
+            Dictionary containing extracted clauses with positions
+        """
+        try:
+            if clause_types is None:
+                clause_types = list(self.clause_types.keys())
+            
+            if len(text) > self.config.MAX_PROMPT_CHARS:
+                return await self._extract_clauses_chunked_async(text, clause_types, tier)
+            
+            prompt = self._build_clause_extraction_prompt(text, clause_types)
+            response = await self._tier_model(tier).generate_content_async(
+                prompt, generation_config=self._clause_generation_config()
+            )
+            
+            clause_data = self._build_clause_data(response.text, clause_types, text)
+            if tier == 'flash':
+                clause_data['clauses'] = await self.review_high_importance_clauses_async(clause_data['clauses'])
+            return clause_data
+            
+        except Exception as e:
+            logger.error(f"Async clause extraction failed: {e}")
+            return self._empty_clause_data(clause_types, text)
+    
+    def extract_clauses_batch(self, texts: List[str], clause_types: List[str] = None,
+                              tier: str = 'flash') -> List[Dict[str, Any]]:
+        """
+        Extract clauses from several documents with their requests in flight together
+        
+        Args:
+            texts: Document texts to analyze
+            clause_types: Specific clause types to look for (default: all)
+            tier: Model tier for extraction ('flash' or 'pro')
+            
+        Returns:
+            List of clause data dictionaries, in the same order as texts
+        """
+        async def _gather():
+            return await asyncio.gather(*[
+                self.extract_clauses_async(text, clause_types, tier) for text in texts
+            ])
+        
+        try:
+            clause_results = run_coroutine(_gather())
+            logger.info("Successfully extracted clauses for %s documents", len(clause_results))
+            return list(clause_results)
+        except Exception as e:
+            logger.error(f"Batch clause extraction failed: {e}")
+            return [self._empty_clause_data(clause_types, text) for text in texts]
+    
+    async def _extract_clauses_chunked_async(self, text: str, clause_types: List[str], tier: str) -> Dict[str, Any]:
+        """
+        Extract clauses from an oversized document chunk by chunk
+        
+        Args:
+            text: The document text to analyze
+            clause_types: Specific clause types to look for
+            tier: Model tier for extraction ('flash' or 'pro')
+            
+        Returns:
+            Dictionary containing the deduplicated clauses from every chunk
+        """
+        chunks = chunk_text(text, self.config.MAX_PROMPT_CHARS, self.config.CHUNK_OVERLAP_CHARS)
+        logger.info("Extracting clauses from %s document chunks", len(chunks))
+        
+        chunk_results = await asyncio.gather(*[
+            self.extract_clauses_async(chunk, clause_types, tier) for chunk in chunks
+        ])
+        
+        # Overlapping windows return boundary clauses twice; keep the first copy
+        seen = set()
+        clauses = []
+        for chunk_data in chunk_results:
+            for clause in chunk_data['clauses']:
+                key = (clause.get('clause_type'), clause.get('clause_text', '').strip()[:256])
+                if key not in seen:
+                    seen.add(key)
+                    clauses.append(clause)
+        
+        return {
+            'clauses': clauses,
+            'total_clauses_found': len(clauses),
+            'clause_types_searched': clause_types,
+            'document_length': len(text),
+            'chunks_processed': len(chunks)
+        }
+    
+    def review_high_importance_clauses(self, clauses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Re-evaluate only the clauses the flash pass labeled HIGH with the pro model
+        
+        Args:
+            clauses: Clauses returned by the flash extraction
+            
+        Returns:
+            The same clauses, with importance and context of HIGH clauses refined
+        """
+        high_indices = [i for i, c in enumerate(clauses) if c.get('importance') == 'HIGH']
+        if not high_indices:
+            return clauses
+        
+        try:
+            response = self.model.generate_content(
+                self._build_review_prompt([clauses[i] for i in high_indices]),
+                generation_config=self._review_generation_config()
+            )
+            return self._apply_review(clauses, high_indices, response.text)
+        except Exception as e:
+            logger.error(f"High-importance clause review failed: {e}")
+            return clauses
+    
+    async def review_high_importance_clauses_async(self, clauses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Async variant of review_high_importance_clauses"""
+        high_indices = [i for i, c in enumerate(clauses) if c.get('importance') == 'HIGH']
+        if not high_indices:
+            return clauses
+        
+        try:
+            response = await self.model.generate_content_async(
+                self._build_review_prompt([clauses[i] for i in high_indices]),
+                generation_config=self._review_generation_config()
+            )
+            return self._apply_review(clauses, high_indices, response.text)
+        except Exception as e:
+            logger.error(f"Async high-importance clause review failed: {e}")
+            return clauses
+    
+    def _tier_model(self, tier: str):
+        """Map a model tier name to the configured model"""
+        return self.model if tier == 'pro' else self.flash_model
+    
+    def _build_review_prompt(self, clauses: List[Dict[str, Any]]) -> str:
+        """Build a focused prompt that re-checks a handful of clauses"""
+        clause_lines = [
+            f"{i}. [{c.get('clause_type', 'UNKNOWN')}] {c.get('clause_text', '')}"
+            for i, c in enumerate(clauses)
+        ]
+        
+        return f"""
+        You are a senior legal expert reviewing clauses that a first pass flagged as high importance.
+        For each numbered clause below, confirm or correct its importance (HIGH/MEDIUM/LOW)
+        and give a precise one-sentence explanation of what it means for the parties.
+
+        Clauses:
+        {chr(10).join(clause_lines)}
+
+        Return a JSON array with one object per clause, in the same order:
+        [{{"index": 0, "importance": "HIGH", "context": "..."}}]
+        """
+    
+    def _review_generation_config(self) -> genai.GenerationConfig:
+        """Constrain the review reply to index/importance/context objects"""
+        return genai.GenerationConfig(
+            response_mime_type="application/json",
+            response_schema={
+                'type': 'ARRAY',
+                'items': {
+                    'type': 'OBJECT',
+                    'properties': {
+                        'index': {'type': 'INTEGER'},
+                        'importance': {'type': 'STRING', 'enum': ['HIGH', 'MEDIUM', 'LOW']},
+                        'context': {'type': 'STRING'}
+                    },
+                    'required': ['index', 'importance', 'context']
+                }
+            }
+        )
+    
+    def _apply_review(self, clauses: List[Dict[str, Any]], high_indices: List[int],
+                      response_text: str) -> List[Dict[str, Any]]:
+        """Merge the pro review back into the clause list"""
+        reviewed = list(clauses)
+        for item in _loads_json(response_text):
+            position = item.get('index')
+            if isinstance(position, int) and 0 <= position < len(high_indices):
+                clause_index = high_indices[position]
+                reviewed[clause_index] = {
+                    **reviewed[clause_index],
+                    'importance': item.get('importance', 'HIGH'),
+                    'context': item.get('context') or reviewed[clause_index].get('context', '')
+                }
+        return reviewed
+    
+    def _build_clause_data(self, response_text: str, clause_types: List[str], text: str) -> Dict[str, Any]:
+        """Parse a clause extraction response and attach metadata"""
+        extracted_clauses = self._parse_clause_response(response_text)
+        
+        return {
+            'clauses': extracted_clauses,
+            'total_clauses_found': len(extracted_clauses),
+            'clause_types_searched': clause_types,
+            'document_length': len(text)
+        }
+    
+    def _empty_clause_data(self, clause_types: List[str], text: str) -> Dict[str, Any]:
+        """Clause data returned when extraction fails"""
+        return {
+            'clauses': [],
+            'total_clauses_found': 0,
+            'clause_types_searched': clause_types or [],
+            'document_length': len(text),
+            'error': 'Clause extraction failed'
+        }
+    
+    def _build_clause_extraction_prompt(self, text: str, clause_types: List[str]) -> str:
+        """Build the prompt for clause extraction"""
+        return _CLAUSE_PROMPT_HEAD + text + _clause_prompt_tail(tuple(clause_types))
+    
+    def _clause_generation_config(self) -> genai.GenerationConfig:
+        """Constrain the model to emit a JSON array matching the clause structure"""
+        return genai.GenerationConfig(
+            response_mime_type="application/json",
+            response_schema={
+                'type': 'ARRAY',
+                'items': {
+                    'type': 'OBJECT',
+                    'properties': {
+                        'clause_type': {'type': 'STRING', 'enum': list(self.clause_types.keys())},
+                        'clause_text': {'type': 'STRING'},
+                        'context': {'type': 'STRING'},
+                        'importance': {'type': 'STRING', 'enum': ['HIGH', 'MEDIUM', 'LOW']},
+                        'section': {'type': 'STRING'}
+                    },
+                    'required': ['clause_type', 'clause_text', 'context', 'importance', 'section']
+                }
+            }
+        )
+    
+    def _is_complete_json_array(self, response_text: str) -> bool:
+        """Check whether the streamed text already holds a complete JSON array"""
+        try:
+            _loads_json(response_text)
+            return True
+        except ValueError:
+            return False
     
     def _parse_clause_response(self, response_text: str) -> List[Dict[str, Any]]:
         """Parse JSON response from Gemini and clean up clauses"""
         try:
-            # Try to find JSON in the response
-            start_idx = response_text.find('[')
-            end_idx = response_text.rfind(']') + 1
+            # Structured output mode returns a bare JSON array
+            clauses = _loads_json(response_text)
             
-            if start_idx != -1 and end_idx > start_idx:
-                json_str = response_text[start_idx:end_idx]
-                clauses = json.loads(json_str)
-            else:
-                # Try parsing entire response as JSON
-                clauses = json.loads(response_text)
+            # Fill any missing fields from the defaults and skip clauses whose text is too short or empty
+            return [
+                {**_CLAUSE_DEFAULTS, **clause, 'clause_text': clause_text}
+                for clause in clauses
+                if isinstance(clause, dict) and 'clause_type' in clause
+                and len(clause_text := clause.get('clause_text', '').strip()) > 20
+            ]
             
-            # Validate and clean clauses
-            cleaned_clauses = []
-            for clause in clauses:
-                if isinstance(clause, dict) and 'clause_type' in clause and 'clause_text' in clause:
-                    # Ensure all required fields exist
-                    cleaned_clause = {
-                        'clause_type': clause.get('clause_type', ''),
-                        'clause_text': clause.get('clause_text', '').strip(),
-                        'context': clause.get('context', ''),
-                        'importance': clause.get('importance', 'MEDIUM'),
-                        'section': clause.get('section', 'Unknown')
-                    }
-                    
-                    # Skip if clause text is too short or empty
-                    if len(cleaned_clause['clause_text']) > 20:
-                        cleaned_clauses.append(cleaned_clause)
-            
-            return cleaned_clauses
-            
-        except json.JSONDecodeError:
+        except ValueError:
+            # Covers both json.JSONDecodeError and jiter parse errors; last resort only
             logger.warning("Failed to parse JSON response, attempting fallback parsing")
             return self._fallback_clause_parsing(response_text)
         except Exception as e:
@@ -180,21 +478,20 @@ class GeminiClauseExtractor:
             line = line.strip()
             
             # Look for clause type indicators
-            for clause_type in self.clause_types.keys():
-                if clause_type.lower() in line.lower() and ':' in line:
-                    if current_clause:
-                        clauses.append(current_clause)
-                    current_clause = {
-                        'clause_type': clause_type,
-                        'clause_text': '',
-                        'context': '',
-                        'importance': 'MEDIUM',
-                        'section': 'Unknown'
-                    }
-                    break
+            match = _CLAUSE_TYPE_RE.search(line) if ':' in line else None
+            if match:
+                if current_clause:
+                    clauses.append(current_clause)
+                current_clause = {
+                    'clause_type': match.group(0).upper(),
+                    'clause_text': '',
+                    'context': '',
+                    'importance': 'MEDIUM',
+                    'section': 'Unknown'
+                }
             
             # Add to current clause text
-            if current_clause and line and not any(keyword in line.lower() for keyword in ['type:', 'context:', 'importance:']):
+            if current_clause and line and not _FIELD_LABEL_RE.search(line):
                 if len(line) > 20:  # Likely clause text
                     current_clause['clause_text'] = line
         
@@ -215,39 +512,32 @@ class GeminiClauseExtractor:
             Text with HTML highlighting markers
         """
         try:
-            highlighted_text = text
-            
-            # Color coding for different clause types
-            color_map = {
-                'TERMINATION': '#ffcccc',      # Light red
-                'PAYMENT': '#ccffcc',          # Light green
-                'INDEMNIFICATION': '#ffcc99',  # Light orange
-                'CONFIDENTIALITY': '#ccccff',  # Light blue
-                'INTELLECTUAL_PROPERTY': '#ffccff', # Light purple
-                'FORCE_MAJEURE': '#ffffcc',    # Light yellow
-                'GOVERNING_LAW': '#ccffff',    # Light cyan
-                'WARRANTIES': '#f0ccff',       # Light magenta
-                'LIMITATION_LIABILITY': '#ffccdd', # Light pink
-                'ASSIGNMENT': '#ccffdd',       # Light mint
-                'AMENDMENT': '#ddccff',        # Light lavender
-                'DELIVERY': '#ddffcc'          # Light lime
-            }
-            
-            # Sort clauses by text length (longest first) to avoid nested highlighting issues
-            sorted_clauses = sorted(clauses, key=lambda x: len(x.get('clause_text', '')), reverse=True)
-            
-            for i, clause in enumerate(sorted_clauses):
+            # Keep the first clause seen for each distinct clause text
+            clause_map = {}
+            for clause in clauses:
                 clause_text = clause.get('clause_text', '').strip()
+                if clause_text and clause_text not in clause_map:
+                    clause_map[clause_text] = clause
+            
+            # Build the output in one pass over the original text, never rescanning inserted HTML
+            parts = []
+            position = 0
+            for start, end, clause_text in self._find_clause_spans(text, clause_map):
+                clause = clause_map[clause_text]
                 clause_type = clause.get('clause_type', '')
+                span_template = _SPAN_TEMPLATES.get(clause_type)
+                if span_template is None:
+                    # Escape braces so a model-returned type survives the second format below
+                    span_template = _SPAN_TEMPLATE.format(
+                        color='#f0f0f0', clause_type=clause_type.replace('{', '{{').replace('}', '}}')
+                    )
                 
-                if clause_text and clause_text in highlighted_text:
-                    color = color_map.get(clause_type, '#f0f0f0')
-                    
-                    # Create highlight span
-                    highlight_span = f'<span style="background-color: {color}; padding: 2px; border-left: 3px solid #333; margin: 2px;" title="{clause_type}: {clause.get("context", "")}">{clause_text}</span>'
-                    
-                    # Replace first occurrence
-                    highlighted_text = highlighted_text.replace(clause_text, highlight_span, 1)
+                parts.append(text[position:start])
+                parts.append(span_template.format(ctx=clause.get('context', ''), txt=clause_text))
+                position = end
+            
+            parts.append(text[position:])
+            highlighted_text = ''.join(parts)
             
             return highlighted_text
             
@@ -255,6 +545,53 @@ class GeminiClauseExtractor:
             logger.error(f"Text highlighting failed: {e}")
             return text  # Return original text if highlighting fails
     
+    def _find_clause_spans(self, text: str, clause_texts) -> List[Tuple[int, int, str]]:
+        """
+        Locate the first occurrence of each clause text as non-overlapping spans
+        
+        Args:
+            text: Original document text
+            clause_texts: Clause texts to look for
+            
+        Returns:
+            List of (start, end, clause_text) tuples ordered by position
+        """
+        first_starts = {}
+        
+        if ahocorasick is not None:
+            # Single multi-pattern scan over the document
+            automaton = ahocorasick.Automaton()
+            for clause_text in clause_texts:
+                automaton.add_word(clause_text, clause_text)
+            automaton.make_automaton()
+            
+            pattern_count = len(automaton)
+            for end_index, clause_text in automaton.iter(text):
+                if clause_text not in first_starts:
+                    first_starts[clause_text] = end_index - len(clause_text) + 1
+                    # Only first occurrences are highlighted, so stop once every clause is placed
+                    if len(first_starts) == pattern_count:
+                        break
+        else:
+            for clause_text in clause_texts:
+                start = text.find(clause_text)
+                if start != -1:
+                    first_starts[clause_text] = start
+        
+        # Earliest start wins, longest match breaks ties; drop anything overlapping.
+        # Keys are precomputed into the tuples so the sort compares tuples natively.
+        candidates = [(start, -len(clause_text), clause_text) for clause_text, start in first_starts.items()]
+        candidates.sort()
+        
+        spans = []
+        last_end = 0
+        for start, negative_length, clause_text in candidates:
+            if start >= last_end:
+                last_end = start - negative_length
+                spans.append((start, last_end, clause_text))
+        
+        return spans
+    
     def generate_clause_summary(self, clauses: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
         Generate a summary report of extracted clauses
@@ -277,7 +614,7 @@ class GeminiClauseExtractor:
             
             # Analyze clause distribution
             clause_distribution = {}
-            importance_counts = {'HIGH': 0, 'MEDIUM': 0, 'LOW': 0}
+            importance_counts = dict.fromkeys(_IMPORTANCE_LEVELS, 0)
             
             for clause in clauses:
                 clause_type = clause.get('clause_type', 'UNKNOWN')
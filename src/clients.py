@@ -0,0 +1,222 @@
+"""
+Shared Gemini clients
+Components reuse one configured client and model objects instead of reconfiguring per instance
+"""
+
+import asyncio
+import functools
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Dict, List, Optional, Tuple, TypeVar, Union
+import google.generativeai as genai
+from .config import Config
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    from google import genai as genai_sdk
+except ImportError:
+    genai_sdk = None
+
+# Response text of recent prompts, most recently used last
+_RESPONSE_CACHE: "OrderedDict[str, str]" = OrderedDict()
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
+# Event loop shared by every async Gemini call, started on first use
+_EVENT_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_EVENT_LOOP_LOCK = threading.Lock()
+
+T = TypeVar('T')
+
+
+def _event_loop() -> asyncio.AbstractEventLoop:
+    """The process-wide event loop, running forever in a daemon thread"""
+    global _EVENT_LOOP
+    with _EVENT_LOOP_LOCK:
+        if _EVENT_LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='gemini-event-loop', daemon=True).start()
+            _EVENT_LOOP = loop
+        return _EVENT_LOOP
+
+
+def run_coroutine(coroutine: Awaitable[T]) -> T:
+    """
+    Run a coroutine to completion from synchronous code, on the shared event loop
+    
+    The SDK's async client binds to the loop it is first used on, so sync entry points
+    must not start a fresh loop per call with asyncio.run: once that loop is closed,
+    every later async request fails with "Event loop is closed".
+    
+    Args:
+        coroutine: Coroutine to run
+        
+    Returns:
+        The coroutine's result
+        
+    Raises:
+        RuntimeError: When called from a coroutine running on the shared loop, which would deadlock
+    """
+    loop = _event_loop()
+    try:
+        running_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        running_loop = None
+    if running_loop is loop:
+        coroutine.close()
+        raise RuntimeError("run_coroutine() would block the shared event loop; await the coroutine instead")
+    
+    return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+
+# API key the Gemini SDK is currently configured with
+_CONFIGURED_API_KEY: Optional[str] = None
+_CONFIGURE_LOCK = threading.Lock()
+
+
+def _configure(api_key: str) -> None:
+    """Configure the Gemini SDK when the API key changes; reconfiguring discards its pooled channels"""
+    global _CONFIGURED_API_KEY
+    with _CONFIGURE_LOCK:
+        if api_key != _CONFIGURED_API_KEY:
+            genai.configure(api_key=api_key)
+            _CONFIGURED_API_KEY = api_key
+
+
+@functools.lru_cache(maxsize=None)
+def _generative_model(model_name: str, api_key: str, system_instruction: Optional[str],
+                      response_schema: Optional[str]) -> genai.GenerativeModel:
+    _configure(api_key)
+    generation_config = genai.GenerationConfig(
+        response_mime_type="application/json", response_schema=json.loads(response_schema)
+    ) if response_schema is not None else None
+    return genai.GenerativeModel(model_name, system_instruction=system_instruction, generation_config=generation_config)
+
+
+def get_generative_model(model_name: str, system_instruction: Optional[str] = None,
+                         response_schema: Optional[Dict[str, Any]] = None) -> genai.GenerativeModel:
+    """
+    Get the process-wide Gemini model for a model name
+    
+    Args:
+        model_name: Gemini model name
+        system_instruction: Optional fixed instructions sent ahead of every prompt
+        response_schema: Optional schema; replies are then JSON matching it
+        
+    Returns:
+        GenerativeModel shared by every component using that model, instructions and schema
+    """
+    # The schema is keyed by its canonical JSON since dicts are not hashable
+    schema_key = json.dumps(response_schema, sort_keys=True) if response_schema is not None else None
+    # The SDK holds one global key, so follow Config when it has been rotated since the model was built
+    _configure(Config.GEMINI_API_KEY)
+    return _generative_model(model_name, Config.GEMINI_API_KEY, system_instruction, schema_key)
+
+
+@functools.lru_cache(maxsize=None)
+def _batch_client(api_key: str):
+    return genai_sdk.Client(api_key=api_key)
+
+
+def get_batch_client():
+    """
+    Get the process-wide google-genai client used for Batch API jobs
+    
+    Returns:
+        google-genai Client, or None when the google-genai package is not installed
+    """
+    if genai_sdk is None:
+        return None
+    return _batch_client(Config.GEMINI_API_KEY)
+
+
+def get_models() -> Tuple[genai.GenerativeModel, genai.GenerativeModel]:
+    """
+    Get the shared (pro, flash) model pair used by the analysis components
+    
+    Returns:
+        Tuple of the GEMINI_MODEL and GEMINI_FLASH_MODEL models
+    """
+    return get_generative_model(Config.GEMINI_MODEL), get_generative_model(Config.GEMINI_FLASH_MODEL)
+
+
+def _response_cache_key(model: genai.GenerativeModel, prompt: Union[str, List[str]]) -> str:
+    """Hash of the model name, its system instruction and generation config, and the prompt (or caller-supplied key)"""
+    if not isinstance(prompt, str):
+        prompt = '\0'.join(prompt)
+    data = (
+        f"{model.model_name}\0{getattr(model, '_system_instruction', None)}\0"
+        f"{getattr(model, '_generation_config', None)}\0{prompt}"
+    ).encode('utf-8')
+    if blake3 is not None:
+        return blake3.blake3(data).hexdigest()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _cached_response(cache_key: str) -> Optional[str]:
+    with _RESPONSE_CACHE_LOCK:
+        response_text = _RESPONSE_CACHE.get(cache_key)
+        if response_text is not None:
+            _RESPONSE_CACHE.move_to_end(cache_key)
+        return response_text
+
+
+def _store_response(cache_key: str, response_text: str) -> None:
+    with _RESPONSE_CACHE_LOCK:
+        _RESPONSE_CACHE[cache_key] = response_text
+        _RESPONSE_CACHE.move_to_end(cache_key)
+        while len(_RESPONSE_CACHE) > Config.RESPONSE_CACHE_MAX_ENTRIES:
+            _RESPONSE_CACHE.popitem(last=False)
+
+
+def generate_text(model: genai.GenerativeModel, prompt: Union[str, List[str]], cache_key: Optional[str] = None) -> str:
+    """
+    Generate a response, serving repeated prompts to the same model from memory
+    
+    Args:
+        model: Shared Gemini model
+        prompt: Prompt text, or a list of text parts sent as one message
+        cache_key: Short key identifying the prompt, e.g. a document ID plus question,
+            so long prompts are not re-hashed on every call
+        
+    Returns:
+        Response text
+    """
+    if not Config.RESPONSE_CACHE_ENABLED:
+        return model.generate_content(prompt).text
+    
+    cache_key = _response_cache_key(model, prompt if cache_key is None else cache_key)
+    response_text = _cached_response(cache_key)
+    if response_text is None:
+        response_text = model.generate_content(prompt).text
+        _store_response(cache_key, response_text)
+    return response_text
+
+
+async def generate_text_async(model: genai.GenerativeModel, prompt: Union[str, List[str]], cache_key: Optional[str] = None) -> str:
+    """
+    Generate a response without blocking the event loop, serving repeated prompts from memory
+    
+    Args:
+        model: Shared Gemini model
+        prompt: Prompt text, or a list of text parts sent as one message
+        cache_key: Short key identifying the prompt, e.g. a document ID plus question,
+            so long prompts are not re-hashed on every call
+        
+    Returns:
+        Response text
+    """
+    if not Config.RESPONSE_CACHE_ENABLED:
+        return (await model.generate_content_async(prompt)).text
+    
+    cache_key = _response_cache_key(model, prompt if cache_key is None else cache_key)
+    response_text = _cached_response(cache_key)
+    if response_text is None:
+        response_text = (await model.generate_content_async(prompt)).text
+        _store_response(cache_key, response_text)
+    return response_text
@@ -3,31 +3,64 @@ Main Document Processor Module
 Coordinates text extraction, summarization, and entity extraction
 """
 
+import asyncio
+import hashlib
+import io
+import json
 import logging
 import os
-from typing import Dict, Any, Optional, Union
-from pathlib import Path
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, Optional, Union, Tuple
+import google.generativeai as genai
 
-from text_extractor import DocumentAIExtractor, GeminiTextExtractor
-from summarizer import GeminiSummarizer  
-from entity_extractor import GeminiEntityExtractor
-from config import Config
+from .text_extractor import DocumentAIExtractor, GeminiTextExtractor
+from .summarizer import GeminiSummarizer
+from .entity_extractor import GeminiEntityExtractor
+from .clause_extractor import GeminiClauseExtractor
+from .config import Config
+from .clients import get_generative_model, run_coroutine
+from .utils import count_words, get_file_extension, results_to_json
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class LegalDocumentProcessor:
     """Main processor for legal document analysis using Google GenAI tools"""
     
-    def __init__(self):
+    DEFAULT_ANALYSIS_OPTIONS = {
+        'extract_text': True,
+        'generate_summary': True,
+        'extract_entities': True,
+        'summary_type': 'comprehensive',
+        'entity_extraction_type': 'comprehensive',
+        'analyze_risks': True,
+        'generate_bullet_points': True
+    }
+    
+    def __init__(self, api_key: Optional[str] = None):
         self.config = Config()
-        self.config.validate_config()
+        self.config.validate_config(api_key)
         
         # Initialize components
         self.text_extractor = DocumentAIExtractor()
         self.gemini_extractor = GeminiTextExtractor()  # Fallback extractor
         self.summarizer = GeminiSummarizer()
         self.entity_extractor = GeminiEntityExtractor()
+        self.clause_extractor = GeminiClauseExtractor()
+        self.fused_model = get_generative_model(self.config.GEMINI_MODEL)
+        
+        # Step results keyed by document text hash, tagged with their creation time, so resubmitted
+        # documents skip the LLM calls; shared by every session, so guarded by one lock
+        self._analysis_cache: Dict[str, Tuple[float, Any]] = {}
+        self._file_hashes: Dict[str, str] = {}
+        self._analysis_cache_lock = threading.Lock()
         
         logger.info("Legal Document Processor initialized with Google GenAI tools")
     
@@ -35,6 +68,19 @@ class LegalDocumentProcessor:
         """
         Process a legal document through the complete pipeline
         
+        Args:
+            file_path: Path to the document file
+            analysis_options: Dictionary of analysis options
+            
+        Returns:
+            Dictionary containing all analysis results
+        """
+        return run_coroutine(self.process_document_async(file_path, analysis_options))
+    
+    async def process_document_async(self, file_path: str, analysis_options: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Process a legal document, running the independent Gemini calls concurrently
+        
         Args:
             file_path: Path to the document file
             analysis_options: Dictionary of analysis options
@@ -43,19 +89,13 @@ class LegalDocumentProcessor:
             Dictionary containing all analysis results
         """
         if analysis_options is None:
-            analysis_options = {
-                'extract_text': True,
-                'generate_summary': True,
-                'extract_entities': True,
-                'summary_type': 'comprehensive',
-                'entity_extraction_type': 'comprehensive',
-                'analyze_risks': True,
-                'generate_bullet_points': True
-            }
+            analysis_options = dict(self.DEFAULT_ANALYSIS_OPTIONS)
         
         try:
             # Validate file
-            if not self._validate_file(file_path):
+            # Parse the extension once for both validation and extraction
+            file_extension = get_file_extension(file_path)
+            if not self._validate_file(file_path, file_extension):
                 raise ValueError(f"Invalid file: {file_path}")
             
             results = {
@@ -68,7 +108,9 @@ class LegalDocumentProcessor:
             # Step 1: Extract text from document
             if analysis_options.get('extract_text', True):
                 logger.info("Extracting text from document...")
-                text_data = self._extract_document_text(file_path)
+                # Extraction blocks on parsing and uploads, so keep it off the shared event loop
+                text_data = await asyncio.to_thread(self._extract_document_text, file_path, file_extension)
+                text_data['word_count'] = count_words(text_data.get('text', ''))
                 results['text_extraction'] = text_data
                 
                 if not text_data.get('text'):
@@ -77,52 +119,349 @@ class LegalDocumentProcessor:
                     return results
             
             document_text = text_data['text']
+            text_hash = self._hash_text(document_text)
+            with self._analysis_cache_lock:
+                self._file_hashes.pop(file_path, None)
+                self._file_hashes[file_path] = text_hash
+                while len(self._file_hashes) > self.config.ANALYSIS_CACHE_MAX_ENTRIES:
+                    del self._file_hashes[next(iter(self._file_hashes))]
+            
+            await self._run_analysis_async(results, document_text, text_hash, analysis_options)
+            
+            # A failed fused analysis leaves only its error behind
+            results['status'] = 'failed' if 'error' in results else 'completed'
+            logger.info("Processed document %s: %s", file_path, results['status'])
+            
+            return results
+            
+        except Exception as e:
+            logger.error(f"Document processing failed: {e}")
+            return {
+                'file_path': file_path,
+                'status': 'failed',
+                'error': str(e),
+                'analysis_options': analysis_options
+            }
+    
+    def process_document_bytes(self, data: bytes, suffix: str, analysis_options: Dict[str, Any] = None, file_name: str = None) -> Dict[str, Any]:
+        """
+        Process an in-memory legal document without writing it to disk
+        
+        Args:
+            data: Raw document bytes
+            suffix: File extension including the dot (e.g. '.pdf')
+            analysis_options: Dictionary of analysis options
+            file_name: Optional display name for the document
+            
+        Returns:
+            Dictionary containing all analysis results
+        """
+        return run_coroutine(self.process_document_bytes_async(data, suffix, analysis_options, file_name))
+    
+    async def process_document_bytes_async(self, data: bytes, suffix: str, analysis_options: Dict[str, Any] = None,
+                                           file_name: str = None) -> Dict[str, Any]:
+        """
+        Process an in-memory legal document, running the independent Gemini calls concurrently
+        
+        Args:
+            data: Raw document bytes
+            suffix: File extension including the dot (e.g. '.pdf')
+            analysis_options: Dictionary of analysis options
+            file_name: Optional display name for the document
+            
+        Returns:
+            Dictionary containing all analysis results
+        """
+        if analysis_options is None:
+            analysis_options = dict(self.DEFAULT_ANALYSIS_OPTIONS)
+        
+        file_name = file_name or f"document{suffix}"
+        
+        try:
+            if not self._validate_bytes(data, suffix):
+                raise ValueError(f"Invalid file: {file_name}")
+            
+            results = {
+                'file_name': file_name,
+                'analysis_options': analysis_options,
+                'status': 'processing'
+            }
+            
+            logger.info("Extracting text from document...")
+            # Extraction blocks on parsing and uploads, so keep it off the shared event loop
+            text_data = await asyncio.to_thread(self._extract_document_bytes, data, suffix)
+            text_data['word_count'] = count_words(text_data.get('text', ''))
+            results['text_extraction'] = text_data
+            
+            if not text_data.get('text'):
+                results['status'] = 'failed'
+                results['error'] = 'No text could be extracted from document'
+                return results
+            
+            document_text = text_data['text']
+            await self._run_analysis_async(results, document_text, self._hash_text(document_text), analysis_options)
+            
+            # A failed fused analysis leaves only its error behind
+            results['status'] = 'failed' if 'error' in results else 'completed'
+            logger.info("Processed document %s: %s", file_name, results['status'])
+            
+            return results
+            
+        except Exception as e:
+            logger.error(f"Document processing failed: {e}")
+            return {
+                'file_name': file_name,
+                'status': 'failed',
+                'error': str(e),
+                'analysis_options': analysis_options
+            }
+    
+    async def _run_analysis_async(self, results: Dict[str, Any], document_text: str, text_hash: str,
+                                  analysis_options: Dict[str, Any]) -> None:
+        """
+        Run the requested analysis steps on extracted text, filling results in place
+        
+        Args:
+            results: Result dictionary to update
+            document_text: Extracted document text
+            text_hash: Hash of document_text, used for the step cache
+            analysis_options: Dictionary of analysis options
+        """
+        if analysis_options.get('fused_analysis', False):
+            fused_key = self._cache_key(text_hash, 'fused', analysis_options)
+            fused_results = self._get_cached_step(fused_key)
+            if fused_results is None:
+                # One request covering every facet instead of one request per facet
+                logger.info("Running fused document analysis...")
+                fused_results = await self._fused_analyze(document_text, analysis_options)
+                if self._is_cacheable(fused_results):
+                    self._store_cached_step(fused_key, fused_results)
+            results.update(fused_results)
+        else:
+            # Steps 2-6 only depend on the document text, so run them together
+            semaphore = asyncio.Semaphore(self.config.MAX_CONCURRENT_REQUESTS)
+            
+            async def _limited(coro):
+                async with semaphore:
+                    return await coro
+            
+            tasks = {}
+            # Per-step 'flash'/'pro' overrides; steps without an entry keep their default model
+            model_tiers = analysis_options.get('model_tiers') or {}
             
-            # Step 2: Generate summary
             if analysis_options.get('generate_summary', True):
                 logger.info("Generating document summary...")
                 summary_type = analysis_options.get('summary_type', 'comprehensive')
-                summary_data = self.summarizer.summarize_document(document_text, summary_type)
-                results['summary'] = summary_data
+                tasks['summary'] = self.summarizer.summarize_document_async(
+                    document_text, summary_type, model_tiers.get('summary')
+                )
             
-            # Step 3: Extract entities
-            if analysis_options.get('extract_entities', True):
+            extract_entities = analysis_options.get('extract_entities', True)
+            extract_relationships = analysis_options.get('extract_relationships', False)
+            extraction_type = analysis_options.get('entity_extraction_type', 'comprehensive')
+            
+            if extract_entities and extract_relationships:
+                # Both read the same text, so one request returns both
+                logger.info("Extracting named entities and legal relationships...")
+                tasks['entities_and_relationships'] = self.entity_extractor.extract_entities_and_relationships_async(
+                    document_text, extraction_type, model_tiers.get('entities')
+                )
+            elif extract_entities:
                 logger.info("Extracting named entities...")
-                extraction_type = analysis_options.get('entity_extraction_type', 'comprehensive')
-                entity_data = self.entity_extractor.extract_entities(document_text, extraction_type)
-                results['entities'] = entity_data
+                tasks['entities'] = self.entity_extractor.extract_entities_async(
+                    document_text, extraction_type, model_tiers.get('entities')
+                )
             
-            # Step 4: Generate bullet points
             if analysis_options.get('generate_bullet_points', True):
                 logger.info("Generating bullet points...")
-                bullet_points = self.summarizer.generate_bullet_points(document_text)
-                results['bullet_points'] = bullet_points
+                tasks['bullet_points'] = self.summarizer.generate_bullet_points_async(
+                    document_text, model_tiers.get('bullet_points')
+                )
             
-            # Step 5: Analyze risks
             if analysis_options.get('analyze_risks', True):
                 logger.info("Analyzing legal risks...")
-                risk_analysis = self.summarizer.analyze_legal_risks(document_text)
-                results['risk_analysis'] = risk_analysis
+                tasks['risk_analysis'] = self.summarizer.analyze_legal_risks_async(
+                    document_text, model_tiers.get('risk_analysis')
+                )
             
-            # Step 6: Extract legal relationships
-            if analysis_options.get('extract_relationships', False):
+            if extract_relationships and not extract_entities:
                 logger.info("Extracting legal relationships...")
-                relationships = self.entity_extractor.extract_legal_relationships(document_text)
-                results['relationships'] = relationships
+                tasks['relationships'] = self.entity_extractor.extract_legal_relationships_async(document_text)
             
-            results['status'] = 'completed'
-            logger.info(f"Successfully processed document: {file_path}")
+            # Serve steps already computed for this text from the cache
+            step_params = {
+                'summary': (analysis_options.get('summary_type', 'comprehensive'), model_tiers.get('summary')),
+                'entities': (analysis_options.get('entity_extraction_type', 'comprehensive'), model_tiers.get('entities')),
+                'bullet_points': (model_tiers.get('bullet_points'),),
+                'risk_analysis': (model_tiers.get('risk_analysis'),),
+                'relationships': (),
+                'entities_and_relationships': (
+                    analysis_options.get('entity_extraction_type', 'comprehensive'), model_tiers.get('entities')
+                )
+            }
+            cache_keys = {key: self._cache_key(text_hash, key, step_params[key]) for key in tasks}
+            for key, cache_key in cache_keys.items():
+                cached = self._get_cached_step(cache_key)
+                if cached is not None:
+                    tasks.pop(key).close()
+                    results[key] = cached
             
-            return results
+            step_results = await asyncio.gather(
+                *[_limited(task) for task in tasks.values()], return_exceptions=True
+            )
+            
+            for key, step_result in zip(tasks.keys(), step_results):
+                if isinstance(step_result, Exception):
+                    logger.error(f"Analysis step '{key}' failed: {step_result}")
+                    continue
+                results[key] = step_result
+                if self._is_cacheable(step_result):
+                    self._store_cached_step(cache_keys[key], step_result)
+            
+            # The combined entity step fills both result keys
+            results.update(results.pop('entities_and_relationships', None) or {})
+    
+    async def _fused_analyze(self, text: str, analysis_options: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Analyze a document with a single schema-constrained Gemini request
+        
+        Args:
+            text: Document text
+            analysis_options: Dictionary of analysis options
             
+        Returns:
+            Dictionary of results in the same shapes as the per-task analyses,
+            or a dictionary holding only an 'error' message when the request fails
+        """
+        summary_type = analysis_options.get('summary_type', 'comprehensive')
+        entity_categories = list(self.entity_extractor.entity_categories.keys())
+        
+        string_list = {'type': 'ARRAY', 'items': {'type': 'STRING'}}
+        response_schema = {
+            'type': 'OBJECT',
+            'properties': {
+                'summary': {'type': 'STRING'},
+                'key_points': string_list,
+                'entities': {
+                    'type': 'OBJECT',
+                    'properties': {category: string_list for category in entity_categories}
+                },
+                'clauses': {
+                    'type': 'ARRAY',
+                    'items': {
+                        'type': 'OBJECT',
+                        'properties': {
+                            'clause_type': {'type': 'STRING'},
+                            'clause_text': {'type': 'STRING'},
+                            'context': {'type': 'STRING'},
+                            'importance': {'type': 'STRING', 'enum': ['HIGH', 'MEDIUM', 'LOW']},
+                            'section': {'type': 'STRING'}
+                        },
+                        'required': ['clause_type', 'clause_text']
+                    }
+                },
+                'risks': {
+                    'type': 'OBJECT',
+                    'properties': {
+                        'high_risks': string_list,
+                        'medium_risks': string_list,
+                        'recommendations': string_list,
+                        'compliance_notes': string_list
+                    }
+                },
+                'relationships': {
+                    'type': 'OBJECT',
+                    'properties': {
+                        'CONTRACTUAL_RELATIONSHIPS': string_list,
+                        'LEGAL_OBLIGATIONS': string_list,
+                        'AUTHORITY_RELATIONSHIPS': string_list,
+                        'FINANCIAL_RELATIONSHIPS': string_list
+                    }
+                }
+            },
+            'required': ['summary', 'key_points', 'entities', 'risks']
+        }
+        
+        prompt = f"""
+        You are an expert legal analyst. Analyze the following legal document and return a single JSON object containing:
+        1. summary: a {summary_type} summary of the document
+        2. key_points: the most important legal provisions as concise bullet points
+        3. entities: named entities in these categories: {', '.join(entity_categories)}
+        4. clauses: key legal clauses ({', '.join(self.clause_extractor.clause_types.keys())}) with their exact text
+        5. risks: high and medium risk areas, recommendations, and compliance notes
+        6. relationships: contractual, obligation, authority, and financial relationships between parties
+        
+        Document text:
+        {text}
+        """
+        
+        try:
+            response = await self.fused_model.generate_content_async(
+                prompt,
+                generation_config=genai.GenerationConfig(
+                    response_mime_type="application/json",
+                    response_schema=response_schema
+                )
+            )
+            fused = json.loads(response.text)
         except Exception as e:
-            logger.error(f"Document processing failed: {e}")
-            return {
-                'file_path': file_path,
-                'status': 'failed',
-                'error': str(e),
-                'analysis_options': analysis_options
+            logger.error(f"Fused analysis failed: {e}")
+            return {'error': f"Fused analysis failed: {e}"}
+        
+        summary_text = fused.get('summary', '')
+        key_points = fused.get('key_points', [])
+        entities = {
+            category: entity_list
+            for category, entity_list in fused.get('entities', {}).items()
+            if entity_list
+        }
+        clauses = fused.get('clauses', [])
+        relationships = {
+            category: relationship_list
+            for category, relationship_list in fused.get('relationships', {}).items()
+            if relationship_list
+        }
+        
+        results = {
+            'summary': {
+                'summary': summary_text,
+                'summary_type': summary_type,
+                'original_length': len(text),
+                'summary_length': len(summary_text),
+                'compression_ratio': len(summary_text) / len(text) if len(text) > 0 else 0,
+                'key_points': key_points[:10]
+            },
+            'entities': {
+                'entities': entities,
+                'extraction_type': 'fused',
+                'total_entities': sum(len(entity_list) for entity_list in entities.values()),
+                'categories_found': list(entities.keys()),
+                'text_length': len(text)
+            },
+            'clauses': {
+                'clauses': clauses,
+                'total_clauses_found': len(clauses),
+                'clause_types_searched': list(self.clause_extractor.clause_types.keys()),
+                'document_length': len(text)
+            },
+            'bullet_points': key_points,
+            'risk_analysis': {
+                'high_risks': [],
+                'medium_risks': [],
+                'recommendations': [],
+                'compliance_notes': [],
+                **fused.get('risks', {})
+            }
+        }
+        
+        if analysis_options.get('extract_relationships', False):
+            results['relationships'] = {
+                'relationships': relationships,
+                'analysis_type': 'legal_relationships',
+                'total_relationships': sum(len(rel_list) for rel_list in relationships.values())
             }
+        
+        return results
     
     def process_multiple_documents(self, file_paths: list, analysis_options: Dict[str, Any] = None) -> Dict[str, Any]:
         """
@@ -144,19 +483,57 @@ class LegalDocumentProcessor:
         }
         
         individual_results = []
+        # Batched clause extraction needs every successful result; comparison only the first two
+        use_batch_api = bool(analysis_options and analysis_options.get('use_batch_api', False))
+        
+        # Process documents in parallel threads; each one runs its own Gemini calls
+        with ThreadPoolExecutor(max_workers=self.config.MAX_CONCURRENT_DOCUMENTS) as executor:
+            futures = {
+                executor.submit(self.process_document, file_path, analysis_options): file_path
+                for file_path in file_paths
+            }
+            for completed, future in enumerate(as_completed(futures), start=1):
+                logger.info("Processed document %s/%s: %s", completed, len(file_paths), futures[future])
+                results['individual_results'][futures[future]] = future.result()
         
         for file_path in file_paths:
-            logger.info(f"Processing document {len(individual_results) + 1}/{len(file_paths)}: {file_path}")
-            
-            result = self.process_document(file_path, analysis_options)
-            results['individual_results'][file_path] = result
+            result = results['individual_results'][file_path]
             
             if result['status'] == 'completed':
                 results['processed_successfully'] += 1
-                individual_results.append(result)
+                if use_batch_api or len(individual_results) < 2:
+                    individual_results.append(result)
             else:
                 results['failed'] += 1
         
+        # Extract clauses for all successful documents with one batched fan-out
+        if individual_results and use_batch_api:
+            logger.info("Extracting clauses for %s documents in batch...", len(individual_results))
+            clause_types = analysis_options.get('clause_types')
+            clause_tier = (analysis_options.get('model_tiers') or {}).get('clauses', 'flash')
+            cache_keys = [
+                self._cache_key(self._hash_text(result['text_extraction']['text']), 'clauses', (clause_types, clause_tier))
+                for result in individual_results
+            ]
+            
+            # Only send the documents whose clauses are not cached yet
+            pending = []
+            for i, (result, cache_key) in enumerate(zip(individual_results, cache_keys)):
+                cached = self._get_cached_step(cache_key)
+                if cached is None:
+                    pending.append(i)
+                else:
+                    result['clauses'] = cached
+            
+            if pending:
+                clause_results = self.clause_extractor.extract_clauses_batch(
+                    [individual_results[i]['text_extraction']['text'] for i in pending], clause_types, clause_tier
+                )
+                for i, clause_data in zip(pending, clause_results):
+                    individual_results[i]['clauses'] = clause_data
+                    if self._is_cacheable(clause_data):
+                        self._store_cached_step(cache_keys[i], clause_data)
+        
         # Generate comparison if multiple documents were processed successfully
         if len(individual_results) >= 2 and analysis_options and analysis_options.get('compare_documents', False):
             logger.info("Generating document comparison...")
@@ -164,58 +541,177 @@ class LegalDocumentProcessor:
         
         return results
     
-    def _extract_document_text(self, file_path: str) -> Dict[str, Any]:
+    def to_json(self, results: Dict[str, Any], indent: bool = False) -> bytes:
+        """
+        Serialize processing results for API responses or storage
+        
+        Args:
+            results: Processing results dictionary
+            indent: Pretty-print with two-space indentation
+            
+        Returns:
+            JSON document as UTF-8 bytes
+        """
+        return results_to_json(results, indent)
+    
+    def invalidate_cache(self, file_path: Optional[str] = None) -> int:
+        """
+        Drop cached analysis results
+        
+        Args:
+            file_path: Document whose results should be dropped (default: all documents)
+            
+        Returns:
+            Number of cache entries removed
+        """
+        with self._analysis_cache_lock:
+            if file_path is None:
+                removed = len(self._analysis_cache)
+                self._analysis_cache.clear()
+                self._file_hashes.clear()
+                return removed
+            
+            text_hash = self._file_hashes.pop(file_path, None)
+            if text_hash is None:
+                return 0
+            
+            stale_keys = [key for key in self._analysis_cache if key.startswith(f"{text_hash}|")]
+            for key in stale_keys:
+                del self._analysis_cache[key]
+            return len(stale_keys)
+    
+    def _get_cached_step(self, cache_key: str) -> Any:
+        """Return a cached step result, or None when it is missing or expired"""
+        with self._analysis_cache_lock:
+            entry = self._analysis_cache.get(cache_key)
+            if entry is None:
+                return None
+            
+            created_at, step_result = entry
+            if time.monotonic() - created_at > self.config.ANALYSIS_CACHE_TTL_SECONDS:
+                self._analysis_cache.pop(cache_key, None)
+                return None
+            return step_result
+    
+    def _store_cached_step(self, cache_key: str, step_result: Any) -> None:
+        """Cache a step result, evicting the oldest entries beyond the size limit"""
+        with self._analysis_cache_lock:
+            self._analysis_cache.pop(cache_key, None)
+            self._analysis_cache[cache_key] = (time.monotonic(), step_result)
+            
+            while len(self._analysis_cache) > self.config.ANALYSIS_CACHE_MAX_ENTRIES:
+                del self._analysis_cache[next(iter(self._analysis_cache))]
+    
+    def _hash_text(self, text: str) -> str:
+        """Content hash of document text, using blake3 when it is installed"""
+        data = text.encode('utf-8')
+        if blake3 is not None:
+            return blake3.blake3(data).hexdigest()
+        return hashlib.sha256(data).hexdigest()
+    
+    def _is_cacheable(self, step_result: Any) -> bool:
+        """Check a step result is neither empty nor a fallback carrying an 'error' key, nested or not"""
+        if not step_result:
+            return False
+        if isinstance(step_result, dict):
+            return 'error' not in step_result and not any(
+                isinstance(value, dict) and 'error' in value for value in step_result.values()
+            )
+        return True
+    
+    def _cache_key(self, text_hash: str, step: str, params: Any) -> str:
+        """Build an analysis cache key from the text hash, step name and step parameters"""
+        return f"{text_hash}|{step}|{json.dumps(params, sort_keys=True, default=str)}"
+    
+    def _extract_document_text(self, file_path: str, file_extension: Optional[str] = None) -> Dict[str, Any]:
         """Extract text from document using appropriate method"""
-        file_extension = Path(file_path).suffix.lower()
+        if file_extension is None:
+            file_extension = get_file_extension(file_path)
+        
+        # Dispatch by suffix, then fall back to Gemini; unsupported types go straight to Gemini
+        primary = {
+            '.pdf': self.text_extractor.extract_text_from_pdf,
+            '.docx': self.text_extractor.extract_text_from_docx,
+            '.txt': self.text_extractor.extract_text_from_txt
+        }.get(file_extension)
+        extractors = (primary, self.gemini_extractor.extract_text_from_file) if primary else (self.gemini_extractor.extract_text_from_file,)
+        
+        for extractor in extractors:
+            try:
+                return extractor(file_path)
+            except Exception as e:
+                logger.error(f"Text extraction with {extractor.__name__} failed for {file_path}: {e}")
+        
+        return {
+            'text': '',
+            'pages': 0,
+            'entities': [],
+            'tables': [],
+            'confidence': 0.0
+        }
+    
+    def _extract_document_bytes(self, data: bytes, suffix: str) -> Dict[str, Any]:
+        """Extract text from in-memory document content using appropriate method"""
+        file_extension = suffix.lower()
         
         try:
             if file_extension == '.pdf':
-                return self.text_extractor.extract_text_from_pdf(file_path)
+                return self.text_extractor.extract_text_from_pdf_bytes(data)
             elif file_extension == '.docx':
-                return self.text_extractor.extract_text_from_docx(file_path)
+                return self.text_extractor.extract_text_from_docx(io.BytesIO(data))
             elif file_extension == '.txt':
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    text = f.read()
                 return {
-                    'text': text,
+                    'text': data.decode('utf-8'),
                     'pages': 1,
                     'entities': [],
                     'tables': [],
                     'confidence': 1.0
                 }
-            else:
-                # Try Gemini extractor as fallback
-                return self.gemini_extractor.extract_text_from_file(file_path)
-                
         except Exception as e:
-            logger.error(f"Text extraction failed for {file_path}: {e}")
-            # Try Gemini extractor as final fallback
-            try:
-                return self.gemini_extractor.extract_text_from_file(file_path)
-            except Exception as fallback_error:
-                logger.error(f"Fallback extraction also failed: {fallback_error}")
-                return {
-                    'text': '',
-                    'pages': 0,
-                    'entities': [],
-                    'tables': [],
-                    'confidence': 0.0
-                }
+            logger.error(f"In-memory text extraction failed: {e}")
+        
+        # Gemini needs a file on disk, so only unsupported types or failures pay for one
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
+            tmp_file.write(data)
+            tmp_file_path = tmp_file.name
+        
+        try:
+            return self._extract_document_text(tmp_file_path, file_extension)
+        finally:
+            os.unlink(tmp_file_path)
     
-    def _validate_file(self, file_path: str) -> bool:
+    def _validate_bytes(self, data: bytes, suffix: str) -> bool:
+        """Validate in-memory document content size and type"""
+        max_size = self.config.MAX_FILE_SIZE_MB * 1024 * 1024
+        
+        if len(data) > max_size:
+            logger.error(f"File too large: {len(data)} bytes (max: {max_size} bytes)")
+            return False
+        
+        file_extension = suffix.lower().lstrip('.')
+        if file_extension not in self.config.SUPPORTED_FILE_TYPES:
+            logger.warning(f"File type may not be supported: {file_extension}")
+        
+        return True
+    
+    def _validate_file(self, file_path: str, file_extension: Optional[str] = None) -> bool:
         """Validate if file exists and is supported"""
-        if not os.path.exists(file_path):
+        # One stat call covers both the existence and the size check
+        try:
+            file_size = os.stat(file_path).st_size
+        except OSError:
             logger.error(f"File does not exist: {file_path}")
             return False
         
-        file_size = os.path.getsize(file_path)
         max_size = self.config.MAX_FILE_SIZE_MB * 1024 * 1024
         
         if file_size > max_size:
             logger.error(f"File too large: {file_size} bytes (max: {max_size} bytes)")
             return False
         
-        file_extension = Path(file_path).suffix.lower().lstrip('.')
+        if file_extension is None:
+            file_extension = get_file_extension(file_path)
+        file_extension = file_extension.lstrip('.')
         if file_extension not in self.config.SUPPORTED_FILE_TYPES:
             logger.warning(f"File type may not be supported: {file_extension}")
         
@@ -260,7 +756,7 @@ class LegalDocumentProcessor:
                 text_data = results['text_extraction']
                 stats['text_stats'] = {
                     'character_count': len(text_data.get('text', '')),
-                    'word_count': len(text_data.get('text', '').split()),
+                    'word_count': text_data['word_count'] if 'word_count' in text_data else count_words(text_data.get('text', '')),
                     'page_count': text_data.get('pages', 0),
                     'confidence': text_data.get('confidence', 0.0)
                 }
@@ -3,44 +3,171 @@ Enhanced Document Processor with Clause Extraction and Q&A
 Integrates clause extraction and smart search capabilities
 """
 
+import asyncio
+import datetime
+import functools
+import hashlib
+import io
+import itertools
+import json
 import logging
 import os
-from typing import Dict, Any, Optional, Union, List
-from pathlib import Path
+import re
+import tempfile
+import threading
+import time
+from types import MappingProxyType
+from typing import Dict, Any, Optional, Union, List, Iterator, Tuple
+import google.generativeai as genai
 
-from .text_extractor import DocumentAIExtractor, GeminiTextExtractor
+try:
+    from google.generativeai import caching
+except ImportError:
+    caching = None
 
-from .summarizer import GeminiSummarizer
-from .entity_extractor import GeminiEntityExtractor
-from .clause_extractor import GeminiClauseExtractor
-from .qa_system import GeminiQASystem
+from .clients import run_coroutine
 from .config import Config
+from .utils import count_words, get_file_extension, results_to_json, extract_dates
 
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Simple keyword matching for clause relevance
+_QUESTION_KEYWORD_CLAUSES = MappingProxyType({
+    'payment': ('PAYMENT',),
+    'terminate': ('TERMINATION',),
+    'end': ('TERMINATION',),
+    'liability': ('LIMITATION_LIABILITY', 'INDEMNIFICATION'),
+    'confidential': ('CONFIDENTIALITY',),
+    'intellectual property': ('INTELLECTUAL_PROPERTY',),
+    'ip': ('INTELLECTUAL_PROPERTY',),
+    'law': ('GOVERNING_LAW',),
+    'jurisdiction': ('GOVERNING_LAW',),
+    'force majeure': ('FORCE_MAJEURE',),
+    'assignment': ('ASSIGNMENT',),
+    'warranty': ('WARRANTIES',),
+    'deliver': ('DELIVERY',)
+})
+
+# One scan for every keyword; anchored at word starts so 'end' no longer matches inside 'spend'
+_QUESTION_KEYWORD_RE = re.compile(r'\b(' + '|'.join(re.escape(keyword) for keyword in _QUESTION_KEYWORD_CLAUSES) + ')')
+
+# Mapping order of each keyword, so matches can be visited in that order without scanning the mapping
+_QUESTION_KEYWORD_ORDER = MappingProxyType({keyword: order for order, keyword in enumerate(_QUESTION_KEYWORD_CLAUSES)})
+
+# Heuristics for the local fast path on short documents
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+_AMOUNT_RE = re.compile(r'[$€£¥₹]\s?\d[\d,]*(?:\.\d+)?|\b\d[\d,]*(?:\.\d+)?\s?(?:USD|EUR|GBP|INR|dollars)\b', re.IGNORECASE)
+_ORGANIZATION_RE = re.compile(r'\b(?:[A-Z][\w&.-]*\s+)+(?:Inc|LLC|LLP|Ltd|Limited|Corp|Corporation|GmbH)\b\.?')
+_HIGH_RISK_RE = re.compile(
+    r'\b(?:indemnif\w*|unlimited liability|liquidated damages|penalt\w*|without (?:notice|cause)|'
+    r'sole discretion|waive\w*|irrevocabl\w*)', re.IGNORECASE
+)
+_MEDIUM_RISK_RE = re.compile(
+    r'\b(?:terminat\w*|automatic(?:ally)? renew\w*|exclusiv\w*|non-compete|late fee\w*|interest|arbitration)',
+    re.IGNORECASE
+)
+
+# Keywords marking each clause type for the local fast path
+_LOCAL_CLAUSE_RES = MappingProxyType({
+    clause_type: re.compile(pattern, re.IGNORECASE)
+    for clause_type, pattern in {
+        'TERMINATION': r'\b(?:terminat\w*|expir\w*|cancel\w*)',
+        'PAYMENT': r'\b(?:pay\w*|fees?|invoic\w*|compensation)\b',
+        'INDEMNIFICATION': r'\b(?:indemni\w*|hold harmless)',
+        'CONFIDENTIALITY': r'\b(?:confidential\w*|non-disclosure)',
+        'INTELLECTUAL_PROPERTY': r'\b(?:intellectual property|copyright\w*|patent\w*|trademark\w*|licen[cs]\w*)',
+        'FORCE_MAJEURE': r'\bforce majeure\b',
+        'GOVERNING_LAW': r'\b(?:governing law|governed by|jurisdiction\w*|arbitrat\w*)',
+        'WARRANTIES': r'\b(?:warrant\w*|represent\w*|guarant\w*)',
+        'LIMITATION_LIABILITY': r'\b(?:liabilit\w*|liable)\b',
+        'ASSIGNMENT': r'\bassign\w*',
+        'AMENDMENT': r'\b(?:amend\w*|modif\w*)',
+        'DELIVERY': r'\b(?:deliver\w*|shipment\w*|milestone\w*)'
+    }.items()
+})
+
 class EnhancedLegalDocumentProcessor:
     """Enhanced processor with clause extraction and Q&A capabilities"""
     
-    def __init__(self):
+    DEFAULT_ANALYSIS_OPTIONS = {
+        'extract_text': True,
+        'generate_summary': True,
+        'extract_entities': True,
+        'extract_clauses': True,  # New option
+        'generate_qa_suggestions': True,  # New option
+        'precompute_answers': True,
+        'summary_type': 'comprehensive',
+        'entity_extraction_type': 'comprehensive',
+        'analyze_risks': True,
+        'generate_bullet_points': True,
+        'local_fast_analysis': False,  # Analyze documents under LOCAL_ANALYSIS_MAX_CHARS with local heuristics, no Gemini
+        'highlight_clauses': False  # Build highlighted HTML of the clauses in the document text
+    }
+    
+    def __init__(self, api_key: Optional[str] = None):
         self.config = Config()
-        self.config.validate_config()
+        self.config.validate_config(api_key)
+        
+        # Step results keyed by document text hash, tagged with their creation time
+        self._analysis_cache: Dict[str, Tuple[float, Any]] = {}
+        self._analysis_cache_lock = threading.Lock()
         
-        # Initialize components
-        self.text_extractor = DocumentAIExtractor()
-        self.gemini_extractor = GeminiTextExtractor()
-        self.summarizer = GeminiSummarizer()
-        self.entity_extractor = GeminiEntityExtractor()
-        self.clause_extractor = GeminiClauseExtractor()  # New component
-        self.qa_system = GeminiQASystem()  # New component
+        # Context caches of long documents keyed by text hash, with their expiry time, reused until they expire
+        self._context_caches: Dict[str, Tuple[float, Any]] = {}
+        self._context_cache_lock = threading.Lock()
         
         logger.info("Enhanced Legal Document Processor initialized with clause extraction and Q&A")
     
+    # Components are imported and created on first use so a request only pays
+    # for the clients it actually touches
+    @functools.cached_property
+    def text_extractor(self):
+        from .text_extractor import DocumentAIExtractor
+        return DocumentAIExtractor()
+    
+    @functools.cached_property
+    def gemini_extractor(self):
+        from .text_extractor import GeminiTextExtractor
+        return GeminiTextExtractor()
+    
+    @functools.cached_property
+    def summarizer(self):
+        from .summarizer import GeminiSummarizer
+        return GeminiSummarizer()
+    
+    @functools.cached_property
+    def entity_extractor(self):
+        from .entity_extractor import GeminiEntityExtractor
+        return GeminiEntityExtractor()
+    
+    @functools.cached_property
+    def clause_extractor(self):
+        from .clause_extractor import GeminiClauseExtractor
+        return GeminiClauseExtractor()
+    
+    @functools.cached_property
+    def qa_system(self):
+        from .qa_system import GeminiQASystem
+        return GeminiQASystem()
+    
     def process_document(self, file_path: str, analysis_options: Dict[str, Any] = None) -> Dict[str, Any]:
         """
         Process a legal document with enhanced capabilities
         
+        Args:
+            file_path: Path to the document file
+            analysis_options: Dictionary of analysis options
+            
+        Returns:
+            Dictionary containing all analysis results including clauses and Q&A
+        """
+        return run_coroutine(self.process_document_async(file_path, analysis_options))
+    
+    async def process_document_async(self, file_path: str, analysis_options: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Process a legal document, running the independent Gemini calls concurrently
+        
         Args:
             file_path: Path to the document file
             analysis_options: Dictionary of analysis options
@@ -49,108 +176,660 @@ class EnhancedLegalDocumentProcessor:
             Dictionary containing all analysis results including clauses and Q&A
         """
         if analysis_options is None:
-            analysis_options = {
-                'extract_text': True,
-                'generate_summary': True,
-                'extract_entities': True,
-                'extract_clauses': True,  # New option
-                'generate_qa_suggestions': True,  # New option
-                'summary_type': 'comprehensive',
-                'entity_extraction_type': 'comprehensive',
-                'analyze_risks': True,
-                'generate_bullet_points': True
-            }
+            analysis_options = dict(self.DEFAULT_ANALYSIS_OPTIONS)
         
         try:
-            # Validate file
-            if not self._validate_file(file_path):
-                raise ValueError(f"Invalid file: {file_path}")
+            # Extraction blocks on parsing and uploads, so keep it off the shared event loop
+            results, document_text = await asyncio.to_thread(self._prepare_document, file_path, analysis_options)
+        except Exception as e:
+            return self._failed_document_result(file_path, e, analysis_options)
+        
+        if document_text is None:
+            return results
+        
+        return await self._analyze_prepared_document(results, document_text, analysis_options)
+    
+    async def process_documents(self, file_paths: List[str], analysis_options: Dict[str, Any] = None,
+                                concurrency: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Process a batch of documents, overlapping text extraction with Gemini analysis
+        
+        Extraction runs in worker threads and feeds a bounded queue drained by the
+        analysis workers, so OCR of later files proceeds while earlier files are analyzed.
+        
+        Args:
+            file_paths: Paths to the document files
+            analysis_options: Dictionary of analysis options applied to every document
+            concurrency: Number of extraction and analysis workers (defaults to MAX_CONCURRENT_DOCUMENTS)
+            
+        Returns:
+            List of per-document results in the same order as file_paths
+        """
+        if analysis_options is None:
+            analysis_options = dict(self.DEFAULT_ANALYSIS_OPTIONS)
+        if concurrency is None:
+            concurrency = self.config.MAX_CONCURRENT_DOCUMENTS
+        
+        batch_results: List[Optional[Dict[str, Any]]] = [None] * len(file_paths)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+        extraction_semaphore = asyncio.Semaphore(concurrency)
+        
+        async def _extract(index: int, file_path: str) -> None:
+            async with extraction_semaphore:
+                try:
+                    prepared = await asyncio.to_thread(self._prepare_document, file_path, analysis_options)
+                except Exception as e:
+                    prepared = (self._failed_document_result(file_path, e, analysis_options), None)
+            await queue.put((index, prepared))
+        
+        async def _analyze() -> None:
+            while True:
+                index, (results, document_text) = await queue.get()
+                try:
+                    if document_text is None:
+                        batch_results[index] = results
+                    else:
+                        batch_results[index] = await self._analyze_prepared_document(
+                            results, document_text, analysis_options
+                        )
+                finally:
+                    queue.task_done()
+        
+        workers = [asyncio.create_task(_analyze()) for _ in range(concurrency)]
+        try:
+            await asyncio.gather(*(_extract(index, path) for index, path in enumerate(file_paths)))
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        
+        logger.info("Processed batch of %s documents", len(file_paths))
+        return batch_results
+    
+    def _prepare_document(self, file_path: str, analysis_options: Dict[str, Any]):
+        """
+        Validate a document and extract its text
+        
+        Returns:
+            Tuple of (results, document_text); document_text is None when the
+            results are already final because no text could be extracted
+        """
+        # Parse the extension once for both validation and extraction
+        file_extension = get_file_extension(file_path)
+        if not self._validate_file(file_path, file_extension):
+            raise ValueError(f"Invalid file: {file_path}")
+        
+        results = {
+            'file_path': file_path,
+            'file_name': os.path.basename(file_path),
+            'analysis_options': analysis_options,
+            'status': 'processing'
+        }
+        
+        # Step 1: Extract text from document
+        if not analysis_options.get('extract_text', True):
+            raise ValueError("Text extraction is required for analysis")
+        
+        logger.info("Extracting text from document...")
+        text_data = self._extract_document_text(file_path, file_extension)
+        text_data['word_count'] = count_words(text_data.get('text', ''))
+        results['text_extraction'] = text_data
+        
+        if not text_data.get('text'):
+            results['status'] = 'failed'
+            results['error'] = 'No text could be extracted from document'
+            return results, None
+        
+        return results, text_data['text']
+    
+    async def _analyze_prepared_document(self, results: Dict[str, Any], document_text: str,
+                                         analysis_options: Dict[str, Any]) -> Dict[str, Any]:
+        """Run the Gemini analysis steps on an extracted document"""
+        try:
+            await self._run_analysis_async(results, document_text, analysis_options)
+            
+            results['status'] = 'completed'
+            logger.info("Successfully processed document: %s", results['file_path'])
+            
+            return results
+        
+        except Exception as e:
+            return self._failed_document_result(results['file_path'], e, analysis_options)
+    
+    def _failed_document_result(self, file_path: str, error: Exception, analysis_options: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the result returned when a document cannot be processed"""
+        logger.error(f"Document processing failed: {error}")
+        return {
+            'file_path': file_path,
+            'status': 'failed',
+            'error': str(error),
+            'analysis_options': analysis_options
+        }
+    
+    def process_document_bytes(self, data: bytes, suffix: str, analysis_options: Dict[str, Any] = None, file_name: str = None) -> Dict[str, Any]:
+        """
+        Process an in-memory legal document without writing it to disk
+        
+        Args:
+            data: Raw document bytes
+            suffix: File extension including the dot (e.g. '.pdf')
+            analysis_options: Dictionary of analysis options
+            file_name: Optional display name for the document
+            
+        Returns:
+            Dictionary containing all analysis results including clauses and Q&A
+        """
+        if analysis_options is None:
+            analysis_options = dict(self.DEFAULT_ANALYSIS_OPTIONS)
+        
+        file_name = file_name or f"document{suffix}"
+        
+        try:
+            # Validate content
+            if not self._validate_bytes(data, suffix):
+                raise ValueError(f"Invalid file: {file_name}")
             
             results = {
-                'file_path': file_path,
-                'file_name': os.path.basename(file_path),
+                'file_name': file_name,
                 'analysis_options': analysis_options,
                 'status': 'processing'
             }
             
             # Step 1: Extract text from document
-            if analysis_options.get('extract_text', True):
-                logger.info("Extracting text from document...")
-                text_data = self._extract_document_text(file_path)
-                results['text_extraction'] = text_data
-                
-                if not text_data.get('text'):
-                    results['status'] = 'failed'
-                    results['error'] = 'No text could be extracted from document'
-                    return results
+            logger.info("Extracting text from document...")
+            text_data = self._extract_document_bytes(data, suffix)
+            text_data['word_count'] = count_words(text_data.get('text', ''))
+            results['text_extraction'] = text_data
+            
+            if not text_data.get('text'):
+                results['status'] = 'failed'
+                results['error'] = 'No text could be extracted from document'
+                return results
+            
+            run_coroutine(self._run_analysis_async(results, text_data['text'], analysis_options))
             
-            document_text = text_data['text']
+            results['status'] = 'completed'
+            logger.info("Successfully processed document: %s", file_name)
+            
+            return results
+        
+        except Exception as e:
+            logger.error(f"Document processing failed: {e}")
+            return {
+                'file_name': file_name,
+                'status': 'failed',
+                'error': str(e),
+                'analysis_options': analysis_options
+            }
+    
+    def _get_context_cache(self, document_text: str, text_hash: str):
+        """
+        Upload a long document once so every analysis step, and later re-analyses, can reference it
+        
+        Args:
+            document_text: Extracted document text
+            text_hash: Hash of the document text
             
+        Returns:
+            CachedContent handle, or None when the document is too short or caching is unavailable
+        """
+        if caching is None or len(document_text) < self.config.CONTEXT_CACHE_MIN_CHARS:
+            return None
+        
+        with self._context_cache_lock:
+            entry = self._context_caches.get(text_hash)
+        # Leave a minute of margin so a cache does not expire while the steps are still using it
+        if entry is not None and entry[0] - 60 > time.monotonic():
+            logger.info("Reusing context cache for this document")
+            return entry[1]
+        
+        try:
+            context_cache = caching.CachedContent.create(
+                model=self.config.CONTEXT_CACHE_MODEL,
+                display_name='legal-document',
+                system_instruction="You are an expert legal analyst. The legal document to analyze is provided in this context.",
+                contents=[document_text],
+                ttl=datetime.timedelta(seconds=self.config.CONTEXT_CACHE_TTL_SECONDS)
+            )
+        except Exception as e:
+            logger.error(f"Context cache creation failed, sending the document inline: {e}")
+            return None
+        
+        with self._context_cache_lock:
+            self._context_caches[text_hash] = (time.monotonic() + self.config.CONTEXT_CACHE_TTL_SECONDS, context_cache)
+        return context_cache
+    
+    async def _run_analysis_async(self, results: Dict[str, Any], document_text: str, analysis_options: Dict[str, Any]) -> None:
+        """Run the analysis steps on extracted text concurrently, storing output in results"""
+        # Callers can opt in to analyzing short snippets locally instead of sending them on a Gemini round-trip
+        if analysis_options.get('local_fast_analysis', False) and len(document_text) < self.config.LOCAL_ANALYSIS_MAX_CHARS:
+            logger.info("Document is short; using local fast analysis")
+            results.update(self._local_fast_analysis(document_text, analysis_options))
+            return
+        
+        # Per-step 'flash'/'pro' overrides; steps without an entry keep their default model
+        model_tiers = analysis_options.get('model_tiers') or {}
+        
+        # Steps 2-7 only depend on the document text, so run them together in worker threads
+        semaphore = asyncio.Semaphore(self.config.MAX_CONCURRENT_REQUESTS)
+        
+        text_hash = hashlib.blake2b(document_text.encode('utf-8'), digest_size=16).hexdigest()
+        
+        async def _limited(step, params, func, *args):
+            cache_key = f"{text_hash}|{step}|{json.dumps(params, sort_keys=True, default=str)}"
+            cached = self._get_cached_step(cache_key)
+            if cached is not None:
+                return cached
+            async with semaphore:
+                step_result = await asyncio.to_thread(func, *args)
+            if self._is_cacheable_step(step, step_result):
+                self._store_cached_step(cache_key, step_result)
+            return step_result
+        
+        # Long documents are uploaded once to a context cache that the steps below share
+        # The cache outlives this run and expires after CONTEXT_CACHE_TTL_SECONDS
+        context_cache = await asyncio.to_thread(self._get_context_cache, document_text, text_hash)
+        
+        cached_model = genai.GenerativeModel.from_cached_content(cached_content=context_cache) if context_cache else None
+        tasks = {}
+        
+        # Summary, bullet points and risks share one request when all three are wanted
+        # and the document fits in a single prompt
+        combine_summary_steps = (
+            analysis_options.get('generate_summary', True)
+            and analysis_options.get('generate_bullet_points', True)
+            and analysis_options.get('analyze_risks', True)
+            and (cached_model is not None or len(document_text) <= self.config.MAX_PROMPT_CHARS)
+        )
+        
+        if combine_summary_steps:
+            logger.info("Generating summary, bullet points and risk analysis...")
+            summary_params = (analysis_options.get('summary_type', 'comprehensive'), model_tiers.get('summary'))
+            tasks['_summary_bundle'] = _limited(
+                '_summary_bundle', summary_params,
+                self.summarizer.summarize_with_bullets_and_risks, document_text, *summary_params, cached_model
+            )
+        else:
             # Step 2: Generate summary
             if analysis_options.get('generate_summary', True):
                 logger.info("Generating document summary...")
                 summary_type = analysis_options.get('summary_type', 'comprehensive')
-                summary_data = self.summarizer.summarize_document(document_text, summary_type)
-                results['summary'] = summary_data
-            
-            # Step 3: Extract entities
-            if analysis_options.get('extract_entities', True):
-                logger.info("Extracting named entities...")
-                extraction_type = analysis_options.get('entity_extraction_type', 'comprehensive')
-                entity_data = self.entity_extractor.extract_entities(document_text, extraction_type)
-                results['entities'] = entity_data
-            
-            # Step 4: Extract clauses (NEW)
-            if analysis_options.get('extract_clauses', True):
-                logger.info("Extracting legal clauses...")
-                clause_types = analysis_options.get('clause_types', None)
-                clause_data = self.clause_extractor.extract_clauses(document_text, clause_types)
-                results['clauses'] = clause_data
-                
-                # Generate highlighted text
-                if clause_data.get('clauses'):
-                    highlighted_text = self.clause_extractor.highlight_clauses_in_text(
-                        document_text, clause_data['clauses']
-                    )
-                    results['highlighted_text'] = highlighted_text
-                    
-                    # Generate clause summary
-                    clause_summary = self.clause_extractor.generate_clause_summary(clause_data['clauses'])
-                    results['clause_summary'] = clause_summary
-            
-            # Step 5: Generate Q&A suggestions (NEW)
-            if analysis_options.get('generate_qa_suggestions', True):
-                logger.info("Generating Q&A suggestions...")
-                suggested_questions = self.qa_system.get_suggested_questions(document_text)
-                results['suggested_questions'] = suggested_questions
-                
-                # Store document text for Q&A (truncated for performance)
-                results['qa_ready_text'] = document_text[:10000]  # First 10k characters
-            
+                tasks['summary'] = _limited(
+                    'summary', (summary_type, model_tiers.get('summary')),
+                    self.summarizer.summarize_document, document_text, summary_type, model_tiers.get('summary'), cached_model
+                )
+        
+        # Step 3: Extract entities
+        if analysis_options.get('extract_entities', True):
+            logger.info("Extracting named entities...")
+            extraction_type = analysis_options.get('entity_extraction_type', 'comprehensive')
+            tasks['entities'] = _limited(
+                'entities', (extraction_type, model_tiers.get('entities')),
+                self.entity_extractor.extract_entities, document_text, extraction_type, model_tiers.get('entities'),
+                cached_model
+            )
+        
+        # Step 4: Extract clauses (NEW)
+        if analysis_options.get('extract_clauses', True):
+            logger.info("Extracting legal clauses...")
+            clause_types = analysis_options.get('clause_types', None)
+            tasks['clauses'] = _limited(
+                'clauses', (clause_types, model_tiers.get('clauses', 'flash')),
+                self.clause_extractor.extract_clauses, document_text, clause_types, model_tiers.get('clauses', 'flash'),
+                cached_model
+            )
+        
+        # Step 5: Generate Q&A suggestions (NEW)
+        if analysis_options.get('generate_qa_suggestions', True):
+            logger.info("Generating Q&A suggestions...")
+            tasks['suggested_questions'] = _limited(
+                'suggested_questions', None, self.qa_system.get_suggested_questions, document_text
+            )
+        
+        if not combine_summary_steps:
             # Step 6: Generate bullet points
             if analysis_options.get('generate_bullet_points', True):
                 logger.info("Generating bullet points...")
-                bullet_points = self.summarizer.generate_bullet_points(document_text)
-                results['bullet_points'] = bullet_points
-            
+                tasks['bullet_points'] = _limited(
+                    'bullet_points', model_tiers.get('bullet_points'),
+                    self.summarizer.generate_bullet_points, document_text, model_tiers.get('bullet_points'), cached_model
+                )
+        
             # Step 7: Analyze risks
             if analysis_options.get('analyze_risks', True):
                 logger.info("Analyzing legal risks...")
-                risk_analysis = self.summarizer.analyze_legal_risks(document_text)
-                results['risk_analysis'] = risk_analysis
+                tasks['risk_analysis'] = _limited(
+                    'risk_analysis', model_tiers.get('risk_analysis'),
+                    self.summarizer.analyze_legal_risks, document_text, model_tiers.get('risk_analysis'), cached_model
+                )
+        
+        step_results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+        
+        # A failed step is logged and left out rather than failing the whole document
+        for key, step_result in zip(tasks.keys(), step_results):
+            if isinstance(step_result, Exception):
+                logger.error(f"Analysis step '{key}' failed: {step_result}")
+                continue
+            if key == '_summary_bundle':
+                results.update(step_result)
+            else:
+                results[key] = step_result
+        
+        # Clause post-processing needs the extracted clauses
+        clause_data = results.get('clauses') or {}
+        clause_index = None
+        if clause_data.get('clauses'):
+            # Highlighted HTML is only built for callers that render it
+            if analysis_options.get('highlight_clauses', False):
+                results['highlighted_text'] = self.clause_extractor.highlight_clauses_in_text(
+                    document_text, clause_data['clauses']
+                )
             
-            results['status'] = 'completed'
-            logger.info(f"Successfully processed document: {file_path}")
+            # Generate clause summary
+            results['clause_summary'] = self.clause_extractor.generate_clause_summary(clause_data['clauses'])
             
-            return results
+            # Index clauses by type once so the precomputed answers don't rescan the list
+            # The index stays out of results, which are serialized and cached by the apps
+            clause_index = self.build_clause_index(clause_data['clauses'])
+        
+        if 'suggested_questions' in results:
+            suggested_questions = results['suggested_questions']
+            
+            # Record how much of the document Q&A uses instead of storing a truncated copy
+            results['qa_ready_length'] = min(len(document_text), self.config.QA_CONTEXT_CHARS)
+            
+            # Answer the top suggestions concurrently so clicks are instant
+            if analysis_options.get('precompute_answers', True) and suggested_questions:
+                logger.info("Precomputing answers for suggested questions...")
+                top_questions = suggested_questions[:6]
+                clauses = clause_data.get('clauses', [])
+                context_map = {
+                    question: self.get_clause_context_for_question(
+                        clauses, question, clause_index
+                    )
+                    for question in top_questions
+                } if clauses else {}
+                results['precomputed_answers'] = await self.qa_system.precompute_answers_async(
+                    self.get_qa_ready_text(results), top_questions, context_map
+                )
+    
+    def _is_cacheable_step(self, step: str, step_result: Any) -> bool:
+        """
+        Check whether a step result is worth caching
+        
+        The extractors catch their own errors and return fallback data, which must
+        not be served from the cache or a transient failure would outlive its cause
+        
+        Args:
+            step: Analysis step name
+            step_result: Result returned by the step
+            
+        Returns:
+            False for empty, error-marked or fallback results
+        """
+        if not step_result:
+            return False
+        if isinstance(step_result, dict):
+            # The summary bundle nests one result per step
+            return 'error' not in step_result and not any(
+                isinstance(value, dict) and 'error' in value for value in step_result.values()
+            )
+        if step == 'suggested_questions':
+            return step_result != self.qa_system.default_suggested_questions()
+        return True
+    
+    def _get_cached_step(self, cache_key: str) -> Any:
+        """Return a cached step result, or None when it is missing or expired"""
+        with self._analysis_cache_lock:
+            entry = self._analysis_cache.get(cache_key)
+            if entry is None:
+                return None
+            
+            created_at, step_result = entry
+            if time.monotonic() - created_at > self.config.ANALYSIS_CACHE_TTL_SECONDS:
+                self._analysis_cache.pop(cache_key, None)
+                return None
+            return step_result
+    
+    def _store_cached_step(self, cache_key: str, step_result: Any) -> None:
+        """Cache a step result, evicting the oldest entries beyond the size limit"""
+        with self._analysis_cache_lock:
+            self._analysis_cache.pop(cache_key, None)
+            self._analysis_cache[cache_key] = (time.monotonic(), step_result)
+            
+            while len(self._analysis_cache) > self.config.ANALYSIS_CACHE_MAX_ENTRIES:
+                del self._analysis_cache[next(iter(self._analysis_cache))]
+    
+    def invalidate_cache(self) -> int:
+        """
+        Drop all cached analysis results and delete this processor's context caches
+        
+        Returns:
+            Number of cache entries removed
+        """
+        with self._analysis_cache_lock:
+            removed = len(self._analysis_cache)
+            self._analysis_cache.clear()
+        
+        with self._context_cache_lock:
+            context_caches = list(self._context_caches.values())
+            self._context_caches.clear()
+        for _, context_cache in context_caches:
+            try:
+                context_cache.delete()
+            except Exception as e:
+                logger.error(f"Failed to delete context cache: {e}")
+        
+        return removed
+    
+    def _local_fast_analysis(self, document_text: str, analysis_options: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Analyze a short document with local heuristics instead of Gemini
+        
+        Args:
+            document_text: Extracted document text
+            analysis_options: Dictionary of analysis options
+            
+        Returns:
+            Analysis results in the same shapes as the Gemini steps
+        """
+        sentences = [sentence.strip() for sentence in _SENTENCE_SPLIT_RE.split(document_text) if sentence.strip()]
+        analysis = {'analysis_mode': 'local'}
+        
+        if analysis_options.get('generate_summary', True):
+            summary_text = ' '.join(sentences[:3])
+            analysis['summary'] = {
+                'summary': summary_text,
+                'summary_type': analysis_options.get('summary_type', 'comprehensive'),
+                'original_length': len(document_text),
+                'summary_length': len(summary_text),
+                'compression_ratio': len(summary_text) / len(document_text) if document_text else 0,
+                'key_points': sentences[:5]
+            }
+        
+        if analysis_options.get('extract_entities', True):
+            entities = {
+                'ORGANIZATIONS': list(dict.fromkeys(match.strip() for match in _ORGANIZATION_RE.findall(document_text))),
+                'DATES': extract_dates(document_text),
+                'MONETARY_VALUES': list(dict.fromkeys(_AMOUNT_RE.findall(document_text)))
+            }
+            entities = {category: values[:20] for category, values in entities.items() if values}
+            analysis['entities'] = {
+                'entities': entities,
+                'extraction_type': analysis_options.get('entity_extraction_type', 'comprehensive'),
+                'total_entities': sum(len(values) for values in entities.values()),
+                'categories_found': list(entities),
+                'text_length': len(document_text)
+            }
+        
+        if analysis_options.get('extract_clauses', True):
+            # A sentence counts as a clause of every type whose keywords it mentions
+            clause_types = analysis_options.get('clause_types') or list(_LOCAL_CLAUSE_RES)
+            clauses = [
+                {
+                    'clause_type': clause_type,
+                    'clause_text': sentence,
+                    'context': '',
+                    'importance': 'HIGH' if _HIGH_RISK_RE.search(sentence) else 'MEDIUM',
+                    'section': 'Unknown'
+                }
+                for sentence in sentences
+                for clause_type in clause_types
+                if clause_type in _LOCAL_CLAUSE_RES and _LOCAL_CLAUSE_RES[clause_type].search(sentence)
+            ]
+            analysis['clauses'] = {
+                'clauses': clauses,
+                'total_clauses_found': len(clauses),
+                'clause_types_searched': clause_types,
+                'document_length': len(document_text)
+            }
+            
+            if clauses:
+                if analysis_options.get('highlight_clauses', False):
+                    analysis['highlighted_text'] = self.clause_extractor.highlight_clauses_in_text(document_text, clauses)
+                analysis['clause_summary'] = self.clause_extractor.generate_clause_summary(clauses)
+        
+        if analysis_options.get('generate_bullet_points', True):
+            analysis['bullet_points'] = [f"• {sentence}" for sentence in sentences[:10]]
+        
+        if analysis_options.get('analyze_risks', True):
+            high_risks = [sentence for sentence in sentences if _HIGH_RISK_RE.search(sentence)]
+            analysis['risk_analysis'] = {
+                'high_risks': high_risks,
+                'medium_risks': [
+                    sentence for sentence in sentences
+                    if sentence not in high_risks and _MEDIUM_RISK_RE.search(sentence)
+                ],
+                'recommendations': ["Have a legal professional review the flagged provisions"] if high_risks else [],
+                'compliance_notes': []
+            }
+        
+        if analysis_options.get('generate_qa_suggestions', True):
+            analysis['suggested_questions'] = [
+                question
+                for questions in self.qa_system.question_categories.values()
+                for question in questions[:2]
+            ][:8]
+            analysis['qa_ready_length'] = len(document_text)
+        
+        return analysis
+    
+    def to_json(self, results: Dict[str, Any], indent: bool = False) -> bytes:
+        """
+        Serialize processing results for API responses or storage
+        
+        Args:
+            results: Processing results dictionary
+            indent: Pretty-print with two-space indentation
+            
+        Returns:
+            JSON document as UTF-8 bytes
+        """
+        return results_to_json(results, indent)
+    
+    def get_qa_ready_text(self, results: Dict[str, Any]) -> str:
+        """
+        Get the document text used as Q&A context for a processed document
+        
+        Args:
+            results: Processing results dictionary
+            
+        Returns:
+            Leading slice of the extracted text (truncated for performance)
+        """
+        if 'qa_ready_text' in results:
+            return results['qa_ready_text']
+        
+        text = results.get('text_extraction', {}).get('text', '')
+        return text[:results.get('qa_ready_length', self.config.QA_CONTEXT_CHARS)]
+    
+    def onboard_document(self, document_text: str, extraction_type: str = "comprehensive",
+                         faq_count: int = 1) -> Dict[str, Any]:
+        """
+        Extract entities, suggest questions and answer the first suggestions with a single request
+        
+        Args:
+            document_text: Document text
+            extraction_type: Type of entity extraction ('comprehensive', 'basic', 'specific')
+            faq_count: Number of suggested questions to answer up front
+            
+        Returns:
+            Dictionary with 'entities', 'suggested_questions' and 'faq_answers' in the shapes
+            returned by extract_entities, get_suggested_questions and precompute_answers
+        """
+        # Documents too long for one prompt go through the separate requests
+        if len(document_text) > self.config.MAX_PROMPT_CHARS:
+            suggested_questions = self.qa_system.get_suggested_questions(document_text)
+            return {
+                'entities': self.entity_extractor.extract_entities(document_text, extraction_type),
+                'suggested_questions': suggested_questions,
+                'faq_answers': self.qa_system.precompute_answers(document_text, suggested_questions[:faq_count])
+            }
+        
+        string_list = {'type': 'ARRAY', 'items': {'type': 'STRING'}}
+        generation_config = genai.GenerationConfig(
+            response_mime_type="application/json",
+            response_schema={
+                'type': 'OBJECT',
+                'properties': {
+                    'entities': self.entity_extractor._entity_schema(extraction_type),
+                    'suggested_questions': string_list,
+                    'faq_answers': {
+                        'type': 'ARRAY',
+                        'items': {
+                            'type': 'OBJECT',
+                            'properties': {'question': {'type': 'STRING'}, 'answer': {'type': 'STRING'}},
+                            'required': ['question', 'answer']
+                        }
+                    }
+                },
+                'required': ['entities', 'suggested_questions', 'faq_answers']
+            }
+        )
+        
+        prompt = f"""
+        Analyze this legal document and return a single JSON object with three sections.
+        
+        1. entities:
+        {self.entity_extractor._get_entity_instruction(extraction_type)}
+        
+        2. suggested_questions: 8-10 important questions someone might want to ask about the document,
+           covering key terms and conditions, dates and deadlines, obligations, financial terms and legal implications
+        
+        3. faq_answers: answers to the first {faq_count} suggested question(s) in plain language, based only on
+           the document, citing the relevant section where possible
         
+        Document text:
+        {document_text}
+        """
+        
+        try:
+            combined = json.loads(self.qa_system.flash_model.generate_content(prompt, generation_config=generation_config).text)
+            
+            entity_data = self.entity_extractor._wrap_entity_data(
+                self.entity_extractor._clean_entity_lists(combined.get('entities') or {}), extraction_type, document_text
+            )
+            suggested_questions = self.qa_system.finalize_suggested_questions(combined.get('suggested_questions') or [])
+            faq_answers = {
+                faq['question']: self.qa_system.build_answer_data(document_text, faq['question'], faq['answer'])
+                for faq in (combined.get('faq_answers') or [])[:faq_count]
+            }
+            
+            logger.info("Onboarded document with %s entities and %s suggested questions",
+                        entity_data['total_entities'], len(suggested_questions))
+            return {
+                'entities': entity_data,
+                'suggested_questions': suggested_questions,
+                'faq_answers': faq_answers
+            }
+            
         except Exception as e:
-            logger.error(f"Document processing failed: {e}")
+            logger.error(f"Document onboarding failed: {e}")
             return {
-                'file_path': file_path,
-                'status': 'failed',
-                'error': str(e),
-                'analysis_options': analysis_options
+                'entities': self.entity_extractor._empty_entity_data(extraction_type, document_text),
+                'suggested_questions': self.qa_system.default_suggested_questions(),
+                'faq_answers': {}
             }
     
     def answer_question(self, document_text: str, question: str, context_clauses: List[Dict] = None) -> Dict[str, Any]:
@@ -177,6 +856,35 @@ class EnhancedLegalDocumentProcessor:
                 'context_clauses_used': 0
             }
     
+    def answer_question_stream(self, document_text: str, question: str, context_clauses: List[Dict] = None) -> Iterator[str]:
+        """
+        Stream the answer to a question about the processed document
+        
+        Args:
+            document_text: Document text
+            question: User's question
+            context_clauses: Optional relevant clauses for context
+            
+        Yields:
+            Partial answer text chunks
+        """
+        return self.qa_system.answer_question_stream(document_text, question, context_clauses)
+    
+    def build_answer_data(self, document_text: str, question: str, answer_text: str, context_clauses: List[Dict] = None) -> Dict[str, Any]:
+        """
+        Build the answer data dictionary for a streamed answer
+        
+        Args:
+            document_text: Document text
+            question: User's question
+            answer_text: Full streamed answer text
+            context_clauses: Clauses used as context
+            
+        Returns:
+            Answer data dictionary
+        """
+        return self.qa_system.build_answer_data(document_text, question, answer_text, context_clauses)
+    
     def search_document(self, document_text: str, search_query: str) -> Dict[str, Any]:
         """
         Perform smart search within the document
@@ -199,13 +907,30 @@ class EnhancedLegalDocumentProcessor:
                 'error': str(e)
             }
     
-    def get_clause_context_for_question(self, clauses: List[Dict], question: str) -> List[Dict]:
+    def build_clause_index(self, clauses: List[Dict]) -> Dict[str, List[int]]:
+        """
+        Index clause positions by clause type
+        
+        Args:
+            clauses: List of extracted clauses
+            
+        Returns:
+            Dictionary mapping clause type to the positions of its clauses
+        """
+        clause_index = {}
+        for position, clause in enumerate(clauses):
+            clause_index.setdefault(clause.get('clause_type'), []).append(position)
+        
+        return clause_index
+    
+    def get_clause_context_for_question(self, clauses: List[Dict], question: str, clause_index: Dict[str, List[int]] = None) -> List[Dict]:
         """
         Find relevant clauses that might help answer a question
         
         Args:
             clauses: List of extracted clauses
             question: User's question
+            clause_index: Optional index from build_clause_index
             
         Returns:
             List of relevant clauses
@@ -214,33 +939,25 @@ class EnhancedLegalDocumentProcessor:
             relevant_clauses = []
             question_lower = question.lower()
             
-            # Simple keyword matching for clause relevance
-            keyword_mapping = {
-                'payment': ['PAYMENT'],
-                'terminate': ['TERMINATION'],
-                'end': ['TERMINATION'],
-                'liability': ['LIMITATION_LIABILITY', 'INDEMNIFICATION'],
-                'confidential': ['CONFIDENTIALITY'],
-                'intellectual property': ['INTELLECTUAL_PROPERTY'],
-                'ip': ['INTELLECTUAL_PROPERTY'],
-                'law': ['GOVERNING_LAW'],
-                'jurisdiction': ['GOVERNING_LAW'],
-                'force majeure': ['FORCE_MAJEURE'],
-                'assignment': ['ASSIGNMENT'],
-                'warranty': ['WARRANTIES'],
-                'deliver': ['DELIVERY']
-            }
+            if clause_index is None:
+                clause_index = self.build_clause_index(clauses)
             
-            # Find clauses based on keywords in question
-            for keyword, clause_types in keyword_mapping.items():
-                if keyword in question_lower:
-                    for clause in clauses:
-                        if clause.get('clause_type') in clause_types:
-                            relevant_clauses.append(clause)
+            # Find clauses based on keywords in question, in keyword order and without repeats
+            matched_keywords = sorted(set(_QUESTION_KEYWORD_RE.findall(question_lower)), key=_QUESTION_KEYWORD_ORDER.__getitem__)
+            seen_positions = set()
+            for keyword in matched_keywords:
+                positions = sorted(
+                    position
+                    for clause_type in _QUESTION_KEYWORD_CLAUSES[keyword]
+                    for position in clause_index.get(clause_type, [])
+                    if position not in seen_positions
+                )
+                seen_positions.update(positions)
+                relevant_clauses.extend(clauses[position] for position in positions)
             
             # If no keyword matches, return high importance clauses
             if not relevant_clauses:
-                relevant_clauses = [c for c in clauses if c.get('importance') == 'HIGH'][:3]
+                relevant_clauses = list(itertools.islice((c for c in clauses if c.get('importance') == 'HIGH'), 3))
             
             return relevant_clauses[:3]  # Limit to 3 most relevant
             
@@ -248,58 +965,95 @@ class EnhancedLegalDocumentProcessor:
             logger.error(f"Failed to find relevant clauses: {e}")
             return []
     
-    def _extract_document_text(self, file_path: str) -> Dict[str, Any]:
+    def _extract_document_text(self, file_path: str, file_extension: Optional[str] = None) -> Dict[str, Any]:
         """Extract text from document using appropriate method"""
-        file_extension = Path(file_path).suffix.lower()
+        if file_extension is None:
+            file_extension = get_file_extension(file_path)
+        
+        # Dispatch by suffix, then fall back to Gemini; unsupported types go straight to Gemini
+        primary = {
+            '.pdf': self.text_extractor.extract_text_from_pdf,
+            '.docx': self.text_extractor.extract_text_from_docx,
+            '.txt': self.text_extractor.extract_text_from_txt
+        }.get(file_extension)
+        extractors = (primary, self.gemini_extractor.extract_text_from_file) if primary else (self.gemini_extractor.extract_text_from_file,)
+        
+        for extractor in extractors:
+            try:
+                return extractor(file_path)
+            except Exception as e:
+                logger.error(f"Text extraction with {extractor.__name__} failed for {file_path}: {e}")
+        
+        return {
+            'text': '',
+            'pages': 0,
+            'entities': [],
+            'tables': [],
+            'confidence': 0.0
+        }
+    
+    def _extract_document_bytes(self, data: bytes, suffix: str) -> Dict[str, Any]:
+        """Extract text from in-memory document content using appropriate method"""
+        file_extension = suffix.lower()
         
         try:
             if file_extension == '.pdf':
-                return self.text_extractor.extract_text_from_pdf(file_path)
+                return self.text_extractor.extract_text_from_pdf_bytes(data)
             elif file_extension == '.docx':
-                return self.text_extractor.extract_text_from_docx(file_path)
+                return self.text_extractor.extract_text_from_docx(io.BytesIO(data))
             elif file_extension == '.txt':
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    text = f.read()
                 return {
-                    'text': text,
+                    'text': data.decode('utf-8'),
                     'pages': 1,
                     'entities': [],
                     'tables': [],
                     'confidence': 1.0
                 }
-            else:
-                # Try Gemini extractor as fallback
-                return self.gemini_extractor.extract_text_from_file(file_path)
-                
         except Exception as e:
-            logger.error(f"Text extraction failed for {file_path}: {e}")
-            # Try Gemini extractor as final fallback
-            try:
-                return self.gemini_extractor.extract_text_from_file(file_path)
-            except Exception as fallback_error:
-                logger.error(f"Fallback extraction also failed: {fallback_error}")
-                return {
-                    'text': '',
-                    'pages': 0,
-                    'entities': [],
-                    'tables': [],
-                    'confidence': 0.0
-                }
+            logger.error(f"In-memory text extraction failed: {e}")
+        
+        # Gemini needs a file on disk, so only unsupported types or failures pay for one
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
+            tmp_file.write(data)
+            tmp_file_path = tmp_file.name
+        
+        try:
+            return self._extract_document_text(tmp_file_path)
+        finally:
+            os.unlink(tmp_file_path)
     
-    def _validate_file(self, file_path: str) -> bool:
+    def _validate_bytes(self, data: bytes, suffix: str) -> bool:
+        """Validate in-memory document content size and type"""
+        max_size = self.config.MAX_FILE_SIZE_MB * 1024 * 1024
+        
+        if len(data) > max_size:
+            logger.error(f"File too large: {len(data)} bytes (max: {max_size} bytes)")
+            return False
+        
+        file_extension = suffix.lower().lstrip('.')
+        if file_extension not in self.config.SUPPORTED_FILE_TYPES:
+            logger.warning(f"File type may not be supported: {file_extension}")
+        
+        return True
+    
+    def _validate_file(self, file_path: str, file_extension: Optional[str] = None) -> bool:
         """Validate if file exists and is supported"""
-        if not os.path.exists(file_path):
+        # One stat call covers both the existence and the size check
+        try:
+            file_size = os.stat(file_path).st_size
+        except OSError:
             logger.error(f"File does not exist: {file_path}")
             return False
         
-        file_size = os.path.getsize(file_path)
         max_size = self.config.MAX_FILE_SIZE_MB * 1024 * 1024
         
         if file_size > max_size:
             logger.error(f"File too large: {file_size} bytes (max: {max_size} bytes)")
             return False
         
-        file_extension = Path(file_path).suffix.lower().lstrip('.')
+        if file_extension is None:
+            file_extension = get_file_extension(file_path)
+        file_extension = file_extension.lstrip('.')
         if file_extension not in self.config.SUPPORTED_FILE_TYPES:
             logger.warning(f"File type may not be supported: {file_extension}")
         
@@ -339,23 +1093,23 @@ class EnhancedLegalDocumentProcessor:
                 report_lines.append("-"*30)
                 
                 for clause in results['clauses']['clauses']:
-                    clause_type = clause.get('clause_type', 'Unknown')
-                    importance = clause.get('importance', 'MEDIUM')
-                    context = clause.get('context', 'No context available')
-                    
-                    report_lines.append(f"### {clause_type} [{importance}]")
-                    report_lines.append(f"**Context:** {context}")
-                    report_lines.append(f"**Text:** {clause.get('clause_text', '')[:200]}...")
-                    report_lines.append("")
+                    report_lines.extend((
+                        f"### {clause.get('clause_type', 'Unknown')} [{clause.get('importance', 'MEDIUM')}]",
+                        f"**Context:** {clause.get('context', 'No context available')}",
+                        f"**Text:** {clause.get('clause_text', '')[:200]}...",
+                        ""
+                    ))
             
             # Entities
             if 'entities' in results and results['entities'].get('entities'):
                 report_lines.append("## EXTRACTED ENTITIES")
                 report_lines.append("-"*30)
                 
-                for category, entity_list in results['entities']['entities'].items():
-                    if entity_list:
-                        report_lines.append(f"**{category.replace('_', ' ').title()}:** {', '.join(entity_list[:5])}")
+                report_lines.extend(
+                    f"**{category.replace('_', ' ').title()}:** {', '.join(entity_list[:5])}"
+                    for category, entity_list in results['entities']['entities'].items()
+                    if entity_list
+                )
                 report_lines.append("")
             
             # Risk analysis
@@ -366,22 +1120,21 @@ class EnhancedLegalDocumentProcessor:
                 
                 if risk_data.get('high_risks'):
                     report_lines.append("**HIGH RISKS:**")
-                    for risk in risk_data['high_risks']:
-                        report_lines.append(f"• {risk}")
+                    report_lines.extend(f"• {risk}" for risk in risk_data['high_risks'])
                     report_lines.append("")
                 
                 if risk_data.get('recommendations'):
                     report_lines.append("**RECOMMENDATIONS:**")
-                    for rec in risk_data['recommendations']:
-                        report_lines.append(f"• {rec}")
+                    report_lines.extend(f"• {rec}" for rec in risk_data['recommendations'])
                     report_lines.append("")
             
             # Suggested questions
             if 'suggested_questions' in results:
                 report_lines.append("## SUGGESTED QUESTIONS")
                 report_lines.append("-"*30)
-                for i, question in enumerate(results['suggested_questions'][:5], 1):
-                    report_lines.append(f"{i}. {question}")
+                report_lines.extend(
+                    f"{i}. {question}" for i, question in enumerate(results['suggested_questions'][:5], 1)
+                )
                 report_lines.append("")
             
             report_lines.append("="*50)
@@ -3,24 +3,58 @@ Gemini API-based Entity Extraction Module
 Replaces BERT NER model with Google Gemini for legal named entity recognition
 """
 
+import asyncio
 import json
 import logging
-from typing import Dict, Any, List, Optional
+import re
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 import google.generativeai as genai
 from .config import Config
+from .clients import generate_text, generate_text_async, get_generative_model, get_models, run_coroutine
+from .utils import chunk_text
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import jiter
+except ImportError:
+    jiter = None
 
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_JSON_DECODER = json.JSONDecoder()
+_BULLET_RE = re.compile(r'(?:[-*•]|\d+\.)\s*(.*)')
+
+def _load_json_object(response_text: str) -> Any:
+    """
+    Parse the JSON object embedded in a model response
+    
+    The outermost braces are parsed with orjson when it is installed. If that span
+    is not valid JSON (e.g. trailing prose contains braces), the stdlib decoder reads
+    just the first complete object instead. orjson's decode error subclasses
+    json.JSONDecodeError, so callers only handle the latter.
+    """
+    start_idx = response_text.find('{')
+    if start_idx == -1:
+        # No object delimiters; try to parse the entire response as JSON
+        return json.loads(response_text)
+    
+    json_str = response_text[start_idx:response_text.rfind('}') + 1]
+    try:
+        return orjson.loads(json_str) if orjson is not None else json.loads(json_str)
+    except json.JSONDecodeError:
+        return _JSON_DECODER.raw_decode(response_text, start_idx)[0]
+
 class GeminiEntityExtractor:
     """Legal named entity recognition using Google Gemini API"""
     
     def __init__(self):
         self.config = Config()
-        genai.configure(api_key=self.config.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel(self.config.GEMINI_MODEL)
-        self.flash_model = genai.GenerativeModel(self.config.GEMINI_FLASH_MODEL)
+        self.model, self.flash_model = get_models()
         
         # Define legal entity categories
         self.entity_categories = {
@@ -33,50 +67,204 @@ class GeminiEntityExtractor:
             'AGREEMENTS': 'Contract types, agreement names, legal instruments',
             'LEGAL_CONCEPTS': 'Legal terms, causes of action, legal principles'
         }
+        
+        # Categories requested by the narrower extraction types; every other type requests all of them
+        self.extraction_type_categories = {
+            'basic': ('PERSONS', 'ORGANIZATIONS', 'DATES', 'LOCATIONS'),
+            'specific': ('CONTRACT_PARTIES', 'LEGAL_DATES', 'FINANCIAL_TERMS', 'LEGAL_CITATIONS')
+        }
+        
+        # Category headings and list items for fallback parsing of non-JSON replies
+        self._category_re = re.compile('|'.join(re.escape(category) for category in self.entity_categories))
     
-    def extract_entities(self, text: str, extraction_type: str = "comprehensive") -> Dict[str, Any]:
+    def extract_entities(self, text: str, extraction_type: str = "comprehensive", tier: Optional[str] = None,
+                         cached_model=None) -> Dict[str, Any]:
         """
         Extract named entities from legal document text
         
         Args:
             text: The document text to analyze
             extraction_type: Type of extraction ('comprehensive', 'basic', 'specific')
+            tier: Optional model tier override ('flash' or 'pro')
+            cached_model: Optional model bound to a context cache holding the document
             
         Returns:
             Dictionary containing extracted entities organized by category
         """
         try:
-            prompt = self._get_entity_extraction_prompt(text, extraction_type)
+            if cached_model is not None:
+                # The document already sits in the cached context, so the prompt only refers to it
+                prompt = self._get_entity_extraction_prompt(self.config.CACHED_DOCUMENT_PLACEHOLDER, extraction_type)
+                response_text = cached_model.generate_content(
+                    prompt,
+                    generation_config=genai.GenerationConfig(
+                        response_mime_type="application/json", response_schema=self._entity_schema(extraction_type)
+                    )
+                ).text
+            elif len(text) > self.config.MAX_PROMPT_CHARS:
+                # On the shared loop: the async client cannot be used from a fresh asyncio.run loop
+                return run_coroutine(self._extract_entities_chunked_async(text, extraction_type, tier))
+            else:
+                prompt = self._get_entity_document_prompt(text)
+                
+                response_text = generate_text(self._instructed_entity_model(extraction_type, tier), prompt)
             
-            # Use flash model for basic extraction, regular model for comprehensive
-            model = self.flash_model if extraction_type == "basic" else self.model
+            entity_data = self._build_entity_data(response_text, extraction_type, text)
             
-            response = model.generate_content(prompt)
+            logger.info("Successfully extracted %s entities", entity_data['total_entities'])
+            return entity_data
             
-            # Parse the JSON response
-            entities = self._parse_entity_response(response.text)
+        except Exception as e:
+            logger.error(f"Entity extraction failed: {e}")
+            return self._empty_entity_data(extraction_type, text)
+    
+    async def extract_entities_async(self, text: str, extraction_type: str = "comprehensive", tier: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Extract named entities without blocking the event loop
+        
+        Args:
+            text: The document text to analyze
+            extraction_type: Type of extraction ('comprehensive', 'basic', 'specific')
+            tier: Optional model tier override ('flash' or 'pro')
             
-            # Add metadata
-            entity_data = {
-                'entities': entities,
-                'extraction_type': extraction_type,
-                'total_entities': sum(len(category_entities) for category_entities in entities.values()),
-                'categories_found': list(entities.keys()),
-                'text_length': len(text)
-            }
+        Returns:
+            Dictionary containing extracted entities organized by category
+        """
+        try:
+            if len(text) > self.config.MAX_PROMPT_CHARS:
+                return await self._extract_entities_chunked_async(text, extraction_type, tier)
+            
+            prompt = self._get_entity_document_prompt(text)
+            response_text = await generate_text_async(self._instructed_entity_model(extraction_type, tier), prompt)
+            
+            entity_data = self._build_entity_data(response_text, extraction_type, text)
             
-            logger.info(f"Successfully extracted {entity_data['total_entities']} entities")
+            logger.info("Successfully extracted %s entities", entity_data['total_entities'])
             return entity_data
             
         except Exception as e:
             logger.error(f"Entity extraction failed: {e}")
-            return {
-                'entities': {},
-                'extraction_type': extraction_type,
-                'total_entities': 0,
-                'categories_found': [],
-                'text_length': len(text)
-            }
+            return self._empty_entity_data(extraction_type, text)
+    
+    def stream_entities(self, text: str, extraction_type: str = "comprehensive",
+                        tier: Optional[str] = None) -> Iterator[Tuple[str, List[str]]]:
+        """
+        Extract named entities, yielding each category as soon as its list is complete
+        
+        The reply is streamed and re-parsed in partial mode as chunks arrive; every
+        category before the one still being generated is final and can be shown early.
+        Without jiter all categories are yielded once the reply is complete.
+        
+        Args:
+            text: The document text to analyze
+            extraction_type: Type of extraction ('comprehensive', 'basic', 'specific')
+            tier: Optional model tier override ('flash' or 'pro')
+            
+        Yields:
+            (category, entities) pairs
+        """
+        try:
+            if len(text) > self.config.MAX_PROMPT_CHARS:
+                yield from self.extract_entities(text, extraction_type, tier)['entities'].items()
+                return
+            
+            model = self._instructed_entity_model(extraction_type, tier)
+            chunks = []
+            emitted = set()
+            
+            for chunk in model.generate_content(self._get_entity_document_prompt(text), stream=True):
+                chunks.append(chunk.text)
+                if jiter is None:
+                    continue
+                
+                partial = self._parse_partial_entities(''.join(chunks))
+                for category in list(partial)[:-1]:
+                    if category not in emitted:
+                        emitted.add(category)
+                        entity_list = self._clean_entity_lists({category: partial[category]}).get(category)
+                        if entity_list:
+                            yield category, entity_list
+            
+            for category, entity_list in self._parse_entity_response(''.join(chunks)).items():
+                if category not in emitted:
+                    yield category, entity_list
+            
+        except Exception as e:
+            logger.error(f"Streaming entity extraction failed: {e}")
+    
+    def _parse_partial_entities(self, response_text: str) -> Dict[str, Any]:
+        """Parse an incomplete JSON entity reply; the last key may still be growing"""
+        start_idx = response_text.find('{')
+        if start_idx == -1:
+            return {}
+        
+        try:
+            parsed = jiter.from_json(response_text[start_idx:].encode('utf-8'), partial_mode='on')
+        except ValueError:
+            # e.g. closing code fence after the object; the final parse handles it
+            return {}
+        return parsed if isinstance(parsed, dict) else {}
+    
+    async def _extract_entities_chunked_async(self, text: str, extraction_type: str,
+                                              tier: Optional[str] = None) -> Dict[str, Any]:
+        """Extract entities from each chunk of an oversized document and merge them per category"""
+        chunks = chunk_text(text, self.config.MAX_PROMPT_CHARS, self.config.CHUNK_OVERLAP_CHARS)
+        logger.info("Extracting entities from %s document chunks", len(chunks))
+        
+        model = self._instructed_entity_model(extraction_type, tier)
+        semaphore = asyncio.Semaphore(self.config.MAX_CONCURRENT_REQUESTS)
+        
+        async def _extract_chunk(chunk: str) -> str:
+            async with semaphore:
+                return await generate_text_async(model, self._get_entity_document_prompt(chunk))
+        
+        response_texts = await asyncio.gather(*[_extract_chunk(chunk) for chunk in chunks])
+        
+        merged: Dict[str, Dict[str, None]] = {}
+        for response_text in response_texts:
+            for category, entity_list in self._parse_entity_response(response_text).items():
+                merged.setdefault(category, {}).update(dict.fromkeys(entity_list))
+        
+        # Same per-category cap as a single-request extraction
+        entity_data = self._wrap_entity_data(
+            {category: list(entity_set)[:20] for category, entity_set in merged.items()}, extraction_type, text
+        )
+        
+        logger.info("Successfully extracted %s entities", entity_data['total_entities'])
+        return entity_data
+    
+    def _entity_model(self, extraction_type: str, tier: Optional[str] = None):
+        """Use flash model for basic extraction, regular model for comprehensive"""
+        if tier == 'flash':
+            return self.flash_model
+        if tier == 'pro':
+            return self.model
+        return self.flash_model if extraction_type == "basic" else self.model
+    
+    def _build_entity_data(self, response_text: str, extraction_type: str, text: str) -> Dict[str, Any]:
+        """Parse the JSON entity response and attach metadata"""
+        return self._wrap_entity_data(self._parse_entity_response(response_text), extraction_type, text)
+    
+    def _wrap_entity_data(self, entities: Dict[str, List[str]], extraction_type: str, text: str) -> Dict[str, Any]:
+        """Attach metadata to parsed entities; the total is computed once here for every caller"""
+        return {
+            'entities': entities,
+            'extraction_type': extraction_type,
+            'total_entities': sum(map(len, entities.values())),
+            'categories_found': list(entities.keys()),
+            'text_length': len(text)
+        }
+    
+    def _empty_entity_data(self, extraction_type: str, text: str) -> Dict[str, Any]:
+        """Entity data returned when extraction fails"""
+        return {
+            'entities': {},
+            'extraction_type': extraction_type,
+            'total_entities': 0,
+            'categories_found': [],
+            'text_length': len(text),
+            'error': 'Entity extraction failed'
+        }
     
     def _get_entity_extraction_prompt(self, text: str, extraction_type: str) -> str:
         """Generate appropriate prompt for entity extraction"""
@@ -89,8 +277,13 @@ class GeminiEntityExtractor:
         
         """
         
+        return base_prompt + self._get_entity_instruction(extraction_type)
+    
+    def _get_entity_instruction(self, extraction_type: str) -> str:
+        """Category list and JSON format for an extraction type; identical for every document"""
+        
         if extraction_type == "basic":
-            categories = ['PERSONS', 'ORGANIZATIONS', 'DATES', 'LOCATIONS']
+            categories = self.extraction_type_categories['basic']
             instruction = f"""
             Extract entities in these categories: {', '.join(categories)}
             
@@ -140,37 +333,34 @@ class GeminiEntityExtractor:
             }}
             """
         
-        return base_prompt + instruction
+        return instruction
+    
+    def _instructed_entity_model(self, extraction_type: str, tier: Optional[str] = None):
+        """Entity model carrying the static extraction instructions as its system instruction"""
+        return get_generative_model(
+            self._entity_model(extraction_type, tier).model_name,
+            "Extract named entities from legal document text. Return the results in valid JSON format.\n"
+            + self._get_entity_instruction(extraction_type),
+            self._entity_schema(extraction_type)
+        )
+    
+    def _entity_schema(self, extraction_type: str) -> Dict[str, Any]:
+        """Response schema with one string list per category the extraction type requests"""
+        string_list = {'type': 'ARRAY', 'items': {'type': 'STRING'}}
+        categories = self.extraction_type_categories.get(extraction_type, tuple(self.entity_categories))
+        return {
+            'type': 'OBJECT',
+            'properties': {category: string_list for category in categories}
+        }
+    
+    def _get_entity_document_prompt(self, text: str) -> str:
+        """Per-request part of the entity prompt when the instructions travel as a system instruction"""
+        return f"Document text:\n{text}"
     
     def _parse_entity_response(self, response_text: str) -> Dict[str, List[str]]:
-        """Parse JSON response from Gemini and clean up entities"""
+        """Parse JSON response from Gemini and clean up entities; the line parser is only a safety net"""
         try:
-            # Try to find JSON in the response
-            start_idx = response_text.find('{')
-            end_idx = response_text.rfind('}') + 1
-            
-            if start_idx != -1 and end_idx != -1:
-                json_str = response_text[start_idx:end_idx]
-                entities = json.loads(json_str)
-            else:
-                # Fallback: try to parse the entire response as JSON
-                entities = json.loads(response_text)
-            
-            # Clean and validate entities
-            cleaned_entities = {}
-            for category, entity_list in entities.items():
-                if isinstance(entity_list, list):
-                    # Remove duplicates and empty strings, limit length
-                    clean_list = list(set([
-                        entity.strip() 
-                        for entity in entity_list 
-                        if entity and len(entity.strip()) > 1
-                    ]))[:20]  # Limit to 20 entities per category
-                    
-                    if clean_list:
-                        cleaned_entities[category] = clean_list
-            
-            return cleaned_entities
+            return self._clean_entity_lists(_load_json_object(response_text))
             
         except json.JSONDecodeError:
             logger.warning("Failed to parse JSON response, attempting fallback parsing")
@@ -179,6 +369,27 @@ class GeminiEntityExtractor:
             logger.error(f"Entity parsing failed: {e}")
             return {}
     
+    def _clean_entity_lists(self, entities: Dict[str, Any]) -> Dict[str, List[str]]:
+        """Clean and validate parsed entity lists"""
+        cleaned_entities = {}
+        for category, entity_list in entities.items():
+            if isinstance(entity_list, list):
+                # Remove duplicates and empty strings in one pass, keeping first-seen order
+                seen = set()
+                clean_list = []
+                for entity in entity_list:
+                    entity = entity.strip() if isinstance(entity, str) else ''
+                    if len(entity) > 1 and entity not in seen:
+                        seen.add(entity)
+                        clean_list.append(entity)
+                        if len(clean_list) == 20:  # Limit to 20 entities per category
+                            break
+                
+                if clean_list:
+                    cleaned_entities[category] = clean_list
+        
+        return cleaned_entities
+    
     def _fallback_entity_parsing(self, response_text: str) -> Dict[str, List[str]]:
         """Fallback method to extract entities when JSON parsing fails"""
         entities = {}
@@ -190,16 +401,15 @@ class GeminiEntityExtractor:
             line = line.strip()
             
             # Check if this line defines a category
-            for category in self.entity_categories.keys():
-                if category in line.upper() and ':' in line:
-                    current_category = category
-                    entities[category] = []
-                    break
-            
-            # Check if this line contains an entity (starts with -, *, or number)
-            if current_category and (line.startswith('-') or line.startswith('*') or 
-                                   any(line.startswith(f"{i}.") for i in range(1, 20))):
-                entity = line.lstrip('-*0123456789. ').strip()
+            category_match = self._category_re.search(line.upper()) if ':' in line else None
+            if category_match:
+                current_category = category_match.group()
+                entities[current_category] = []
+            
+            # Check if this line contains an entity (starts with -, *, • or a number); headings are not entities
+            bullet_match = _BULLET_RE.match(line) if current_category and not category_match else None
+            if bullet_match:
+                entity = bullet_match.group(1).strip()
                 if entity and len(entity) > 1:
                     entities[current_category].append(entity)
         
@@ -216,7 +426,135 @@ class GeminiEntityExtractor:
             Dictionary containing relationship analysis
         """
         try:
-            prompt = f"""
+            return self._build_relationship_data(generate_text(self.model, self._get_relationship_prompt(text)))
+            
+        except Exception as e:
+            logger.error(f"Relationship extraction failed: {e}")
+            return self._empty_relationship_data()
+    
+    async def extract_legal_relationships_async(self, text: str) -> Dict[str, Any]:
+        """
+        Extract relationships between legal entities without blocking the event loop
+        
+        Args:
+            text: The document text to analyze
+            
+        Returns:
+            Dictionary containing relationship analysis
+        """
+        try:
+            return self._build_relationship_data(
+                await generate_text_async(self.model, self._get_relationship_prompt(text))
+            )
+            
+        except Exception as e:
+            logger.error(f"Relationship extraction failed: {e}")
+            return self._empty_relationship_data()
+    
+    def extract_entities_and_relationships(self, text: str, extraction_type: str = "comprehensive",
+                                           tier: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Extract named entities and legal relationships with a single request
+        
+        Args:
+            text: The document text to analyze
+            extraction_type: Type of extraction ('comprehensive', 'basic', 'specific')
+            tier: Optional model tier override ('flash' or 'pro')
+            
+        Returns:
+            Dictionary with 'entities' and 'relationships' in the shapes returned by
+            extract_entities and extract_legal_relationships
+        """
+        if len(text) > self.config.MAX_PROMPT_CHARS:
+            return {
+                'entities': self.extract_entities(text, extraction_type, tier),
+                'relationships': self.extract_legal_relationships(text)
+            }
+        
+        try:
+            response_text = generate_text(
+                self._entity_model(extraction_type, tier), self._get_entities_and_relationships_prompt(text, extraction_type)
+            )
+            return self._split_entities_and_relationships(response_text, extraction_type, text)
+            
+        except Exception as e:
+            logger.error(f"Entity and relationship extraction failed: {e}")
+            return {
+                'entities': self._empty_entity_data(extraction_type, text),
+                'relationships': self._empty_relationship_data()
+            }
+    
+    async def extract_entities_and_relationships_async(self, text: str, extraction_type: str = "comprehensive",
+                                                       tier: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Extract named entities and legal relationships with a single request, without blocking the event loop
+        
+        Args:
+            text: The document text to analyze
+            extraction_type: Type of extraction ('comprehensive', 'basic', 'specific')
+            tier: Optional model tier override ('flash' or 'pro')
+            
+        Returns:
+            Dictionary with 'entities' and 'relationships' in the shapes returned by
+            extract_entities and extract_legal_relationships
+        """
+        if len(text) > self.config.MAX_PROMPT_CHARS:
+            entity_data, relationship_data = await asyncio.gather(
+                self.extract_entities_async(text, extraction_type, tier),
+                self.extract_legal_relationships_async(text)
+            )
+            return {'entities': entity_data, 'relationships': relationship_data}
+        
+        try:
+            response_text = await generate_text_async(
+                self._entity_model(extraction_type, tier), self._get_entities_and_relationships_prompt(text, extraction_type)
+            )
+            return self._split_entities_and_relationships(response_text, extraction_type, text)
+            
+        except Exception as e:
+            logger.error(f"Entity and relationship extraction failed: {e}")
+            return {
+                'entities': self._empty_entity_data(extraction_type, text),
+                'relationships': self._empty_relationship_data()
+            }
+    
+    def _get_entities_and_relationships_prompt(self, text: str, extraction_type: str) -> str:
+        """Generate the prompt for combined entity and relationship extraction"""
+        return self._get_entity_extraction_prompt(text, extraction_type) + """
+            Also identify key relationships between the entities:
+            1. CONTRACTUAL_RELATIONSHIPS: Who has agreements with whom
+            2. LEGAL_OBLIGATIONS: Who owes what to whom
+            3. AUTHORITY_RELATIONSHIPS: Who has authority over whom
+            4. FINANCIAL_RELATIONSHIPS: Who pays what to whom
+            
+            Return a single JSON object with the entities above under "entities" and the
+            relationship descriptions under "relationships":
+            {
+                "entities": {"CATEGORY": ["entity1", "entity2"]},
+                "relationships": {
+                    "CONTRACTUAL_RELATIONSHIPS": ["Party A contracts with Party B for services"],
+                    "LEGAL_OBLIGATIONS": ["Company X must deliver Y by date Z"],
+                    "AUTHORITY_RELATIONSHIPS": ["Court has jurisdiction over the matter"],
+                    "FINANCIAL_RELATIONSHIPS": ["Buyer pays $X to Seller"]
+                }
+            }
+            """
+    
+    def _split_entities_and_relationships(self, response_text: str, extraction_type: str, text: str) -> Dict[str, Any]:
+        """Parse the combined response into entity data and relationship data"""
+        combined = _load_json_object(response_text)
+        
+        entity_data = self._wrap_entity_data(self._clean_entity_lists(combined.get('entities') or {}), extraction_type, text)
+        
+        logger.info("Successfully extracted %s entities", entity_data['total_entities'])
+        return {
+            'entities': entity_data,
+            'relationships': self._wrap_relationship_data(self._clean_entity_lists(combined.get('relationships') or {}))
+        }
+    
+    def _get_relationship_prompt(self, text: str) -> str:
+        """Generate the prompt for legal relationship extraction"""
+        return f"""
             Analyze this legal document and identify key relationships between entities.
             
             Document text: {text}
@@ -235,23 +573,27 @@ class GeminiEntityExtractor:
                 "FINANCIAL_RELATIONSHIPS": ["Buyer pays $X to Seller"]
             }}
             """
-            
-            response = self.model.generate_content(prompt)
-            relationships = self._parse_entity_response(response.text)
-            
-            return {
-                'relationships': relationships,
-                'analysis_type': 'legal_relationships',
-                'total_relationships': sum(len(rel_list) for rel_list in relationships.values())
-            }
-            
-        except Exception as e:
-            logger.error(f"Relationship extraction failed: {e}")
-            return {
-                'relationships': {},
-                'analysis_type': 'legal_relationships',
-                'total_relationships': 0
-            }
+    
+    def _build_relationship_data(self, response_text: str) -> Dict[str, Any]:
+        """Parse the relationship response and attach metadata"""
+        return self._wrap_relationship_data(self._parse_entity_response(response_text))
+    
+    def _wrap_relationship_data(self, relationships: Dict[str, List[str]]) -> Dict[str, Any]:
+        """Attach metadata to parsed relationships"""
+        return {
+            'relationships': relationships,
+            'analysis_type': 'legal_relationships',
+            'total_relationships': sum(map(len, relationships.values()))
+        }
+    
+    def _empty_relationship_data(self) -> Dict[str, Any]:
+        """Relationship data returned when extraction fails"""
+        return {
+            'relationships': {},
+            'analysis_type': 'legal_relationships',
+            'total_relationships': 0,
+            'error': 'Relationship extraction failed'
+        }
     
     def validate_entity_consistency(self, entities: Dict[str, List[str]]) -> Dict[str, Any]:
         """
@@ -277,13 +619,7 @@ class GeminiEntityExtractor:
                 all_entities.extend(entity_list)
             
             # Find potential duplicates (similar strings)
-            potential_dupes = []
-            for i, entity1 in enumerate(all_entities):
-                for j, entity2 in enumerate(all_entities[i+1:], i+1):
-                    if self._similarity_score(entity1.lower(), entity2.lower()) > 0.8:
-                        potential_dupes.append((entity1, entity2))
-            
-            validation_results['potential_duplicates'] = potential_dupes
+            validation_results['potential_duplicates'] = self._find_similar_pairs(all_entities, 0.8)
             
             # Check formatting issues
             formatting_issues = []
@@ -309,33 +645,72 @@ class GeminiEntityExtractor:
             logger.error(f"Entity validation failed: {e}")
             return validation_results
     
+    def _find_similar_pairs(self, all_entities: List[str], threshold: float) -> List[Tuple[str, str]]:
+        """
+        Find entity pairs whose word-set Jaccard similarity exceeds threshold
+        
+        Only pairs sharing at least one word can score above zero, so candidates come
+        from a word index instead of comparing every pair. Entities without words match
+        each other, as in _similarity_score.
+        
+        Args:
+            all_entities: Entities to compare
+            threshold: Minimum similarity (exclusive) for a pair to be reported
+            
+        Returns:
+            (earlier, later) entity pairs in the order a full pairwise scan would find them
+        """
+        word_sets = [frozenset(entity.lower().split()) for entity in all_entities]
+        word_index: Dict[str, List[int]] = {}
+        empty_indices: List[int] = []
+        pairs = []
+        
+        for j, words in enumerate(word_sets):
+            if not words:
+                pairs.extend((i, j) for i in empty_indices)
+                empty_indices.append(j)
+                continue
+            
+            candidates = {i for word in words for i in word_index.get(word, ())}
+            pairs.extend((i, j) for i in candidates if self._jaccard(words, word_sets[i]) > threshold)
+            
+            for word in words:
+                word_index.setdefault(word, []).append(j)
+        
+        pairs.sort()
+        return [(all_entities[i], all_entities[j]) for i, j in pairs]
+    
     def _similarity_score(self, str1: str, str2: str) -> float:
         """Calculate similarity score between two strings"""
         # Simple Jaccard similarity
-        set1 = set(str1.split())
-        set2 = set(str2.split())
-        
+        return self._jaccard(frozenset(str1.split()), frozenset(str2.split()))
+    
+    @staticmethod
+    def _jaccard(set1: frozenset, set2: frozenset) -> float:
+        """Jaccard similarity of two pre-split word sets; two empty sets count as identical"""
         if not set1 and not set2:
             return 1.0
         
-        intersection = len(set1.intersection(set2))
-        union = len(set1.union(set2))
+        intersection = len(set1 & set2)
+        union = len(set1 | set2)
         
         return intersection / union if union > 0 else 0.0
     
-    def generate_entity_report(self, entities: Dict[str, List[str]]) -> str:
+    def generate_entity_report(self, entities: Dict[str, List[str]], total_entities: Optional[int] = None) -> str:
         """
         Generate a formatted report of extracted entities
         
         Args:
             entities: Dictionary of extracted entities
+            total_entities: Precomputed entity count, e.g. entity_data['total_entities']
             
         Returns:
             Formatted string report
         """
         report_lines = ["# Legal Document Entity Analysis Report", ""]
         
-        total_entities = sum(len(entity_list) for entity_list in entities.values())
+        if total_entities is None:
+            total_entities = sum(map(len, entities.values()))
         report_lines.append(f"**Total Entities Found:** {total_entities}")
         report_lines.append("")
         
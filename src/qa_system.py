@@ -3,23 +3,100 @@ Smart Search and Q&A Module using Gemini API
 Provides document-specific question answering and search capabilities
 """
 
+import asyncio
+import functools
+import hashlib
 import logging
-from typing import Dict, Any, List, Optional, Tuple
-import google.generativeai as genai
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Any, List, Optional, Tuple, Iterator, Union
 from .config import Config
+from .clients import generate_text, generate_text_async, get_generative_model, get_models, run_coroutine
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
 
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Sentence boundaries: terminal punctuation followed by whitespace, so decimals like 1.5 stay intact
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+
+class DocumentHandle:
+    """A document's text with its identity and derived data computed once and shared across questions"""
+    
+    __slots__ = ('id', 'text', 'head', '_sentences', '_word_index')
+    
+    def __init__(self, text: str):
+        data = text.encode('utf-8')
+        self.id = blake3.blake3(data).hexdigest() if blake3 is not None else hashlib.blake2b(data, digest_size=16).hexdigest()
+        self.text = text
+        # Leading slice used for question suggestions
+        self.head = text[:2000]
+        self._sentences = None
+        self._word_index = None
+    
+    @property
+    def sentences(self) -> Tuple[str, ...]:
+        """Sentences longer than 20 characters"""
+        if self._sentences is None:
+            self._sentences = tuple(
+                sentence
+                for sentence in (piece.strip() for piece in _SENTENCE_SPLIT_RE.split(self.text))
+                if len(sentence) > 20
+            )
+        return self._sentences
+    
+    @property
+    def word_index(self) -> Dict[str, List[int]]:
+        """Inverted index mapping each lowercased word to the sentences containing it"""
+        if self._word_index is None:
+            index = defaultdict(list)
+            for position, sentence in enumerate(self.sentences):
+                for word in set(sentence.lower().split()):
+                    index[word].append(position)
+            self._word_index = dict(index)
+        return self._word_index
+
+@functools.lru_cache(maxsize=8)
+def _document_handle(text: str) -> DocumentHandle:
+    return DocumentHandle(text)
+
+def get_document(document: Union[str, DocumentHandle]) -> DocumentHandle:
+    """
+    Get the shared handle for a document
+    
+    Args:
+        document: Document text or an existing handle
+        
+    Returns:
+        DocumentHandle; recently seen texts reuse their existing handle
+    """
+    if isinstance(document, DocumentHandle):
+        return document
+    return _document_handle(document)
+
+# Fixed instructions carried as the QA model's system instruction, ahead of every per-question prompt
+_QA_SYSTEM_INSTRUCTION = """
+You are a legal document analyst. Answer the user's question about the legal document they provide accurately and concisely.
+
+Instructions:
+1. Provide a clear, direct answer based on the document content
+2. Quote specific text from the document when possible
+3. If the information is not in the document, clearly state "This information is not specified in the document"
+4. Focus on factual information from the document, not legal advice
+5. If multiple interpretations are possible, mention the key alternatives
+"""
+
 class GeminiQASystem:
     """Document Q&A and smart search using Google Gemini API"""
     
     def __init__(self):
         self.config = Config()
-        genai.configure(api_key=self.config.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel(self.config.GEMINI_MODEL)
-        self.flash_model = genai.GenerativeModel(self.config.GEMINI_FLASH_MODEL)
+        self.model, self.flash_model = get_models()
+        self.qa_model = get_generative_model(self.config.GEMINI_MODEL, _QA_SYSTEM_INSTRUCTION)
         
         # Predefined question categories for legal documents
         self.question_categories = {
@@ -55,12 +132,12 @@ class GeminiQASystem:
             ]
         }
     
-    def answer_question(self, document_text: str, question: str, context_clauses: List[Dict] = None) -> Dict[str, Any]:
+    def answer_question(self, document_text: Union[str, DocumentHandle], question: str, context_clauses: List[Dict] = None) -> Dict[str, Any]:
         """
         Answer a specific question about the document
         
         Args:
-            document_text: Full document text
+            document_text: Full document text or its DocumentHandle
             question: User's question
             context_clauses: Optional list of relevant clauses for context
             
@@ -68,67 +145,134 @@ class GeminiQASystem:
             Dictionary containing answer and supporting information
         """
         try:
-            # Build context from clauses if provided
-            context_info = ""
-            if context_clauses:
-                context_info = "\n\nRelevant clauses for additional context:\n"
-                for clause in context_clauses[:3]:  # Limit to 3 most relevant
-                    context_info += f"- {clause.get('clause_type', '')}: {clause.get('clause_text', '')}\n"
+            document = get_document(document_text)
+            context_info = self._build_context_info(context_clauses)
+            prompt = self._build_qa_prompt(document.text, question, context_info)
+            response_text = generate_text(self.qa_model, prompt, f"qa|{document.id}|{question}|{context_info}")
             
-            prompt = self._build_qa_prompt(document_text, question, context_info)
-            response = self.model.generate_content(prompt)
+            answer_data = self.build_answer_data(document, question, response_text, context_clauses)
             
-            answer_data = {
+            logger.info("Successfully answered question: %s...", question[:50])
+            return answer_data
+            
+        except Exception as e:
+            logger.error(f"Q&A failed for question '{question}': {e}")
+            return {
                 'question': question,
-                'answer': response.text.strip(),
-                'confidence': self._estimate_confidence(response.text),
-                'relevant_sections': self._extract_relevant_sections(document_text, question, response.text),
-                'context_clauses_used': len(context_clauses) if context_clauses else 0
+                'answer': f"Sorry, I couldn't answer this question. Error: {str(e)}",
+                'confidence': 0.0,
+                'relevant_sections': [],
+                'context_clauses_used': 0,
+                'error': str(e)
             }
+    
+    async def answer_question_async(self, document_text: Union[str, DocumentHandle], question: str, context_clauses: List[Dict] = None) -> Dict[str, Any]:
+        """
+        Answer a specific question about the document without blocking the event loop
+        
+        Args:
+            document_text: Full document text or its DocumentHandle
+            question: User's question
+            context_clauses: Optional list of relevant clauses for context
             
-            logger.info(f"Successfully answered question: {question[:50]}...")
-            return answer_data
+        Returns:
+            Dictionary containing answer and supporting information
+        """
+        try:
+            document = get_document(document_text)
+            context_info = self._build_context_info(context_clauses)
+            prompt = self._build_qa_prompt(document.text, question, context_info)
+            response_text = await generate_text_async(self.qa_model, prompt, f"qa|{document.id}|{question}|{context_info}")
+            
+            return self.build_answer_data(document, question, response_text, context_clauses)
             
         except Exception as e:
-            logger.error(f"Q&A failed for question '{question}': {e}")
+            logger.error(f"Async Q&A failed for question '{question}': {e}")
             return {
                 'question': question,
                 'answer': f"Sorry, I couldn't answer this question. Error: {str(e)}",
                 'confidence': 0.0,
                 'relevant_sections': [],
-                'context_clauses_used': 0
+                'context_clauses_used': 0,
+                'error': str(e)
             }
     
-    def _build_qa_prompt(self, document_text: str, question: str, context_info: str = "") -> str:
-        """Build the prompt for question answering"""
+    def answer_question_stream(self, document_text: Union[str, DocumentHandle], question: str, context_clauses: List[Dict] = None) -> Iterator[str]:
+        """
+        Answer a question about the document, yielding the answer as it is generated
         
-        prompt = f"""
-        You are a legal document analyst. Answer the following question about this legal document accurately and concisely.
-
-        Document text:
-        {document_text}
-        {context_info}
-
-        Question: {question}
-
-        Instructions:
-        1. Provide a clear, direct answer based on the document content
-        2. Quote specific text from the document when possible
-        3. If the information is not in the document, clearly state "This information is not specified in the document"
-        4. Focus on factual information from the document, not legal advice
-        5. If multiple interpretations are possible, mention the key alternatives
-
-        Answer:
+        Args:
+            document_text: Full document text or its DocumentHandle
+            question: User's question
+            context_clauses: Optional list of relevant clauses for context
+            
+        Yields:
+            Partial answer text chunks
         """
+        try:
+            context_info = self._build_context_info(context_clauses)
+            prompt = self._build_qa_prompt(get_document(document_text).text, question, context_info)
+            
+            for chunk in self.qa_model.generate_content(prompt, stream=True):
+                if chunk.text:
+                    yield chunk.text
+            
+            logger.info("Successfully streamed answer for question: %s...", question[:50])
+            
+        except Exception as e:
+            logger.error(f"Streaming Q&A failed for question '{question}': {e}")
+            yield f"Sorry, I couldn't answer this question. Error: {str(e)}"
+    
+    def build_answer_data(self, document_text: Union[str, DocumentHandle], question: str, answer_text: str, context_clauses: List[Dict] = None) -> Dict[str, Any]:
+        """
+        Assemble the answer dictionary for a completed answer
         
-        return prompt
+        Args:
+            document_text: Full document text or its DocumentHandle
+            question: User's question
+            answer_text: Full answer text returned by the model
+            context_clauses: Clauses that were supplied as context
+            
+        Returns:
+            Dictionary containing answer and supporting information
+        """
+        return {
+            'question': question,
+            'answer': answer_text.strip(),
+            'confidence': self._estimate_confidence(answer_text),
+            'relevant_sections': self._extract_relevant_sections(document_text, question, answer_text),
+            'context_clauses_used': len(context_clauses) if context_clauses else 0
+        }
+    
+    def _build_context_info(self, context_clauses: List[Dict] = None) -> str:
+        """Build the additional clause context section of the Q&A prompt"""
+        context_info = ""
+        if context_clauses:
+            context_info = "\n\nRelevant clauses for additional context:\n"
+            for clause in context_clauses[:3]:  # Limit to 3 most relevant
+                context_info += f"- {clause.get('clause_type', '')}: {clause.get('clause_text', '')}\n"
+        
+        return context_info
+    
+    def _build_qa_prompt(self, document_text: str, question: str, context_info: str = "") -> List[str]:
+        """
+        Build the per-question prompt; the fixed instructions live in the QA model's system instruction
+        
+        The prompt is returned as content parts so the document text is passed by reference
+        instead of being copied into a new string for every question.
+        """
+        return [
+            "Document text:\n",
+            document_text,
+            f"{context_info}\n\nQuestion: {question}\n\nAnswer:"
+        ]
     
-    def search_document(self, document_text: str, search_query: str, max_results: int = 5) -> Dict[str, Any]:
+    def search_document(self, document_text: Union[str, DocumentHandle], search_query: str, max_results: int = 5) -> Dict[str, Any]:
         """
         Perform intelligent search within the document
         
         Args:
-            document_text: Full document text
+            document_text: Full document text or its DocumentHandle
             search_query: Search query or keywords
             max_results: Maximum number of results to return
             
@@ -136,11 +280,12 @@ class GeminiQASystem:
             Dictionary containing search results
         """
         try:
+            document = get_document(document_text)
             prompt = f"""
             Search through this legal document for information related to: "{search_query}"
 
             Document text:
-            {document_text}
+            {document.text}
 
             Find and extract up to {max_results} relevant sections or paragraphs that relate to the search query.
             For each result, provide:
@@ -160,19 +305,21 @@ class GeminiQASystem:
             If no relevant information is found, state "No relevant information found for this search query."
             """
             
-            response = self.flash_model.generate_content(prompt)  # Use flash for faster search
+            response_text = generate_text(  # Use flash for faster search
+                self.flash_model, prompt, f"search|{document.id}|{search_query}|{max_results}"
+            )
             
             # Parse search results
-            search_results = self._parse_search_results(response.text, search_query)
+            search_results = self._parse_search_results(response_text, search_query)
             
             search_data = {
                 'query': search_query,
                 'results': search_results,
                 'total_results': len(search_results),
-                'document_length': len(document_text)
+                'document_length': len(document.text)
             }
             
-            logger.info(f"Search completed for '{search_query}': found {len(search_results)} results")
+            logger.info("Search completed for '%s': found %s results", search_query, len(search_results))
             return search_data
             
         except Exception as e:
@@ -182,7 +329,7 @@ class GeminiQASystem:
                 'results': [],
                 'total_results': 0,
                 'error': str(e),
-                'document_length': len(document_text)
+                'document_length': len(get_document(document_text).text)
             }
     
     def _parse_search_results(self, response_text: str, query: str) -> List[Dict[str, Any]]:
@@ -224,12 +371,12 @@ class GeminiQASystem:
         
         return results[:5]  # Limit to 5 results
     
-    def get_suggested_questions(self, document_text: str, document_type: str = "contract") -> List[str]:
+    def get_suggested_questions(self, document_text: Union[str, DocumentHandle], document_type: str = "contract") -> List[str]:
         """
         Generate suggested questions based on document content
         
         Args:
-            document_text: Document text to analyze
+            document_text: Document text to analyze, or its DocumentHandle
             document_type: Type of document (contract, agreement, etc.)
             
         Returns:
@@ -240,7 +387,7 @@ class GeminiQASystem:
             Analyze this legal document and suggest 8-10 important questions that someone might want to ask about it.
 
             Document text:
-            {document_text[:2000]}...  # First 2000 characters for analysis
+            {get_document(document_text).head}...  # First 2000 characters for analysis
 
             Based on the content, suggest practical questions that would help someone understand:
             - Key terms and conditions
@@ -252,11 +399,11 @@ class GeminiQASystem:
             Return as a simple numbered list of questions.
             """
             
-            response = self.flash_model.generate_content(prompt)
+            response_text = generate_text(self.flash_model, prompt)
             
             # Extract questions from response
             suggested_questions = []
-            lines = response.text.split('\n')
+            lines = response_text.split('\n')
             
             for line in lines:
                 line = line.strip()
@@ -266,33 +413,52 @@ class GeminiQASystem:
                     question = line.split('.', 1)[-1].strip() if '.' in line else line.strip()
                     question = question.lstrip('- •').strip()
                     
-                    if question and len(question) > 10 and question.endswith('?'):
-                        suggested_questions.append(question)
-            
-            # Add category-based questions if we don't have enough
-            if len(suggested_questions) < 6:
-                category_questions = []
-                for category, questions in self.question_categories.items():
-                    category_questions.extend(questions[:2])  # Take 2 from each category
-                
-                # Fill up to 8 total questions
-                for q in category_questions:
-                    if len(suggested_questions) < 8 and q not in suggested_questions:
-                        suggested_questions.append(q)
+                    suggested_questions.append(question)
             
-            return suggested_questions[:10]  # Limit to 10 questions
+            return self.finalize_suggested_questions(suggested_questions)
             
         except Exception as e:
             logger.error(f"Failed to generate suggested questions: {e}")
-            # Return default questions
-            return [
-                "Who are the parties to this agreement?",
-                "What are the main terms and conditions?",
-                "What are the payment obligations?",
-                "How can this agreement be terminated?",
-                "What are the key dates and deadlines?",
-                "What law governs this agreement?"
-            ]
+            return self.default_suggested_questions()
+    
+    def finalize_suggested_questions(self, candidates: List[str]) -> List[str]:
+        """
+        Filter model-suggested questions and top them up from the question categories
+        
+        Args:
+            candidates: Questions suggested by the model
+            
+        Returns:
+            List of suggested questions
+        """
+        suggested_questions = [
+            question for question in (candidate.strip() for candidate in candidates)
+            if question and len(question) > 10 and question.endswith('?')
+        ]
+        
+        # Add category-based questions if we don't have enough
+        if len(suggested_questions) < 6:
+            category_questions = []
+            for category, questions in self.question_categories.items():
+                category_questions.extend(questions[:2])  # Take 2 from each category
+            
+            # Fill up to 8 total questions
+            for q in category_questions:
+                if len(suggested_questions) < 8 and q not in suggested_questions:
+                    suggested_questions.append(q)
+        
+        return suggested_questions[:10]  # Limit to 10 questions
+    
+    def default_suggested_questions(self) -> List[str]:
+        """Questions returned when suggestions cannot be generated"""
+        return [
+            "Who are the parties to this agreement?",
+            "What are the main terms and conditions?",
+            "What are the payment obligations?",
+            "How can this agreement be terminated?",
+            "What are the key dates and deadlines?",
+            "What law governs this agreement?"
+        ]
     
     def _estimate_confidence(self, answer_text: str) -> float:
         """Estimate confidence in the answer based on response characteristics"""
@@ -315,46 +481,107 @@ class GeminiQASystem:
         # Ensure confidence stays within bounds
         return max(0.1, min(1.0, confidence))
     
-    def _extract_relevant_sections(self, document_text: str, question: str, answer: str) -> List[str]:
+    def _extract_relevant_sections(self, document_text: Union[str, DocumentHandle], question: str, answer: str) -> List[str]:
         """Extract relevant document sections that support the answer"""
         sections = []
         
         try:
-            # Simple approach: find sentences in the document that appear in the answer
-            doc_sentences = [s.strip() for s in document_text.split('.') if len(s.strip()) > 20]
-            answer_words = set(answer.lower().split())
-            
-            for sentence in doc_sentences:
-                sentence_words = set(sentence.lower().split())
-                # If there's significant overlap between answer and document sentence
-                overlap = len(answer_words.intersection(sentence_words))
-                if overlap >= 3:  # At least 3 words in common
-                    sections.append(sentence.strip()[:200] + '...' if len(sentence) > 200 else sentence.strip())
-                
-                if len(sections) >= 3:  # Limit to 3 sections
-                    break
+            # Count answer words per document sentence through the document's inverted index,
+            # which is built once and reused across questions
+            document = get_document(document_text)
+            word_index = document.word_index
+            overlaps = Counter()
+            for word in set(answer.lower().split()):
+                overlaps.update(word_index.get(word, ()))
+            
+            # Keep the 3 sentences with the most overlap, at least 3 words in common
+            best = sorted(
+                (position for position, overlap in overlaps.items() if overlap >= 3),
+                key=lambda position: (-overlaps[position], position)
+            )[:3]
+            
+            for position in best:
+                sentence = document.sentences[position]
+                sections.append(sentence[:200] + '...' if len(sentence) > 200 else sentence)
         
         except Exception as e:
             logger.warning(f"Failed to extract relevant sections: {e}")
         
         return sections
     
-    def batch_answer_questions(self, document_text: str, questions: List[str]) -> List[Dict[str, Any]]:
+    def precompute_answers(self, document_text: Union[str, DocumentHandle], questions: List[str], context_map: Dict[str, List[Dict]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Answer several questions concurrently so they are ready before being asked
+        
+        Args:
+            document_text: Document text or its DocumentHandle
+            questions: Questions to answer
+            context_map: Optional mapping of question to relevant clauses
+            
+        Returns:
+            Dictionary mapping each successfully answered question to its answer dictionary
+        """
+        return run_coroutine(self.precompute_answers_async(document_text, questions, context_map))
+    
+    async def precompute_answers_async(self, document_text: Union[str, DocumentHandle], questions: List[str],
+                                       context_map: Dict[str, List[Dict]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Answer several questions concurrently on the caller's event loop
+        
+        Args:
+            document_text: Document text or its DocumentHandle
+            questions: Questions to answer
+            context_map: Optional mapping of question to relevant clauses
+            
+        Returns:
+            Dictionary mapping each successfully answered question to its answer dictionary;
+            failed questions are left out so they are answered live when asked
+        """
+        context_map = context_map or {}
+        semaphore = asyncio.Semaphore(self.config.MAX_CONCURRENT_REQUESTS)
+        document_text = get_document(document_text)
+        
+        async def _limited(question: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.answer_question_async(document_text, question, context_map.get(question))
+        
+        try:
+            answers = await asyncio.gather(*[_limited(question) for question in questions])
+            return {answer['question']: answer for answer in answers if 'error' not in answer}
+        except Exception as e:
+            logger.error(f"Failed to precompute answers: {e}")
+            return {}
+    
+    def batch_answer_questions(self, document_text: Union[str, DocumentHandle], questions: List[str]) -> List[Dict[str, Any]]:
         """
         Answer multiple questions about the document
         
         Args:
-            document_text: Document text
+            document_text: Document text or its DocumentHandle
             questions: List of questions to answer
             
         Returns:
             List of answer dictionaries
         """
-        answers = []
+        return run_coroutine(self.batch_answer_questions_async(document_text, questions))
+    
+    async def batch_answer_questions_async(self, document_text: Union[str, DocumentHandle], questions: List[str]) -> List[Dict[str, Any]]:
+        """
+        Answer multiple questions about the document concurrently
+        
+        Args:
+            document_text: Document text or its DocumentHandle
+            questions: List of questions to answer
+            
+        Returns:
+            List of answer dictionaries in the same order as questions
+        """
+        semaphore = asyncio.Semaphore(self.config.MAX_CONCURRENT_REQUESTS)
+        document_text = get_document(document_text)
         
-        for i, question in enumerate(questions):
-            logger.info(f"Answering question {i+1}/{len(questions)}")
-            answer_data = self.answer_question(document_text, question)
-            answers.append(answer_data)
+        async def _limited(question: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.answer_question_async(document_text, question)
         
-        return answers
\ No newline at end of file
+        logger.info("Answering %s questions", len(questions))
+        return await asyncio.gather(*[_limited(question) for question in questions])
\ No newline at end of file
@@ -3,12 +3,73 @@ Gemini API-based Summarization Module
 Replaces FlanT5 model with Google Gemini for legal document summarization
 """
 
+import asyncio
+import io
+import itertools
+import json
 import logging
-from typing import Dict, Any, Optional, List
+import re
+import time
+from typing import Dict, Any, Optional, List, Tuple, Iterator
 import google.generativeai as genai
 from .config import Config
+from .clients import generate_text, generate_text_async, get_batch_client, get_generative_model, get_models, run_coroutine
+from .utils import chunk_text
+
+# Summary lines worth surfacing as key points: list items (1-5, bullets) or lines naming key/important/critical terms
+_KEY_POINT_RE = re.compile(
+    r'^[^\S\n]*((?:[1-5]\.|[•\-*]).*|.*(?:key|important|critical).*)$', re.MULTILINE | re.IGNORECASE
+)
+
+# Summary prompts, kept terse since they are sent with every document; the document text follows each prefix
+_SUMMARY_INSTRUCTIONS = {
+    'brief': "Brief summary, 2-3 paragraphs: document type and purpose, parties, key obligations and terms.",
+    'executive': "Executive summary, 1 paragraph: essence in business terms, critical legal implications, key decisions.",
+    'comprehensive': (
+        "Comprehensive summary: type, purpose and context; parties and roles; key provisions and obligations; "
+        "dates and deadlines; financial terms; legal implications and risks; compliance; termination and disputes."
+    )
+}
+_SUMMARY_PROMPT_PREFIXES = {
+    summary_type: f"Legal analyst. Summarize this legal document.\n{instruction}\n\nDocument:\n"
+    for summary_type, instruction in _SUMMARY_INSTRUCTIONS.items()
+}
+
+# JSON replies of the bullet point, risk and combined summary requests
+_STRING_LIST = {'type': 'ARRAY', 'items': {'type': 'STRING'}}
+_RISK_ANALYSIS_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'high_risks': _STRING_LIST,
+        'medium_risks': _STRING_LIST,
+        'recommendations': _STRING_LIST,
+        'compliance_notes': _STRING_LIST
+    }
+}
+_SUMMARY_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'summary': {'type': 'STRING'},
+        'key_points': _STRING_LIST
+    },
+    'required': ['summary', 'key_points']
+}
+_SUMMARY_JSON_INSTRUCTION = "\n\nReturn JSON: summary (as above); key_points (up to 10 most important points)."
+_SUMMARY_BUNDLE_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'summary': {'type': 'STRING'},
+        'bullet_points': _STRING_LIST,
+        'risks': _RISK_ANALYSIS_SCHEMA
+    },
+    'required': ['summary', 'bullet_points', 'risks']
+}
+
+# Batch job states after which the job no longer changes
+_BATCH_FINAL_STATES = frozenset({
+    'JOB_STATE_SUCCEEDED', 'JOB_STATE_FAILED', 'JOB_STATE_CANCELLED', 'JOB_STATE_EXPIRED'
+})
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class GeminiSummarizer:
@@ -16,174 +77,466 @@ class GeminiSummarizer:
     
     def __init__(self):
         self.config = Config()
-        genai.configure(api_key=self.config.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel(self.config.GEMINI_MODEL)
-        self.flash_model = genai.GenerativeModel(self.config.GEMINI_FLASH_MODEL)
+        self.model, self.flash_model = get_models()
     
-    def summarize_document(self, text: str, summary_type: str = "comprehensive") -> Dict[str, Any]:
+    def summarize_document(self, text: str, summary_type: str = "comprehensive", tier: Optional[str] = None,
+                           cached_model=None) -> Dict[str, Any]:
         """
         Generate a summary of the legal document
         
         Args:
             text: The document text to summarize
             summary_type: Type of summary ('comprehensive', 'brief', 'executive')
+            tier: Optional model tier override ('flash' or 'pro')
+            cached_model: Optional model bound to a context cache holding the document
             
         Returns:
             Dictionary containing summary and metadata
         """
         try:
-            # Choose appropriate prompt based on summary type
-            prompt = self._get_summary_prompt(text, summary_type)
+            if cached_model is not None:
+                # The document already sits in the cached context, so the prompt only refers to it
+                prompt = self._get_summary_prompt(self.config.CACHED_DOCUMENT_PLACEHOLDER, summary_type)
+            else:
+                # Oversized documents are summarized chunk by chunk, then the chunk summaries are summarized
+                source_text = text
+                if len(text) > self.config.MAX_PROMPT_CHARS:
+                    source_text = run_coroutine(self._summarize_chunks_async(text))
+                
+                # Choose appropriate prompt based on summary type
+                prompt = self._get_summary_prompt(source_text, summary_type)
+            
+            # Key points come back with the summary instead of being parsed out of it
+            summary = self._generate_json(
+                self._summary_model(summary_type, tier), prompt + _SUMMARY_JSON_INSTRUCTION, _SUMMARY_SCHEMA, cached_model
+            )
+            summary_data = self.build_summary_data(summary['summary'], summary_type, text, summary.get('key_points'))
+            
+            logger.info("Successfully generated %s summary", summary_type)
+            return summary_data
             
-            # Use flash model for brief summaries, regular model for comprehensive
-            model = self.flash_model if summary_type == "brief" else self.model
+        except Exception as e:
+            logger.error(f"Summarization failed: {e}")
+            return self._empty_summary_data(summary_type, text)
+    
+    def summarize_document_stream(self, text: str, summary_type: str = "comprehensive", tier: Optional[str] = None,
+                                  cached_model=None) -> Iterator[str]:
+        """
+        Generate a summary of the legal document, yielding it as it is generated
+        
+        Args:
+            text: The document text to summarize
+            summary_type: Type of summary ('comprehensive', 'brief', 'executive')
+            tier: Optional model tier override ('flash' or 'pro')
+            cached_model: Optional model bound to a context cache holding the document
             
-            response = model.generate_content(prompt)
+        Yields:
+            Partial summary text chunks; pass their concatenation to build_summary_data
+        """
+        try:
+            if cached_model is not None:
+                model = cached_model
+                prompt = self._get_summary_prompt(self.config.CACHED_DOCUMENT_PLACEHOLDER, summary_type)
+            else:
+                # Only the final summary of an oversized document is streamed; chunk summaries come first
+                source_text = text
+                if len(text) > self.config.MAX_PROMPT_CHARS:
+                    source_text = run_coroutine(self._summarize_chunks_async(text))
+                
+                model = self._summary_model(summary_type, tier)
+                prompt = self._get_summary_prompt(source_text, summary_type)
+            
+            for chunk in model.generate_content(prompt, stream=True):
+                if chunk.text:
+                    yield chunk.text
+            
+            logger.info("Successfully streamed %s summary", summary_type)
             
-            summary_data = {
-                'summary': response.text,
-                'summary_type': summary_type,
-                'original_length': len(text),
-                'summary_length': len(response.text),
-                'compression_ratio': len(response.text) / len(text) if len(text) > 0 else 0,
-                'key_points': self._extract_key_points(response.text)
-            }
+        except Exception as e:
+            logger.error(f"Streaming summarization failed: {e}")
+            yield f"Error generating summary: {str(e)}"
+    
+    async def summarize_document_async(self, text: str, summary_type: str = "comprehensive", tier: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Generate a summary of the legal document without blocking the event loop
+        
+        Args:
+            text: The document text to summarize
+            summary_type: Type of summary ('comprehensive', 'brief', 'executive')
+            tier: Optional model tier override ('flash' or 'pro')
             
-            logger.info(f"Successfully generated {summary_type} summary")
-            return summary_data
+        Returns:
+            Dictionary containing summary and metadata
+        """
+        try:
+            source_text = text
+            if len(text) > self.config.MAX_PROMPT_CHARS:
+                source_text = await self._summarize_chunks_async(text)
+            
+            prompt = self._get_summary_prompt(source_text, summary_type) + _SUMMARY_JSON_INSTRUCTION
+            summary = await self._generate_json_async(self._summary_model(summary_type, tier), prompt, _SUMMARY_SCHEMA)
+            
+            logger.info("Successfully generated %s summary", summary_type)
+            return self.build_summary_data(summary['summary'], summary_type, text, summary.get('key_points'))
             
         except Exception as e:
             logger.error(f"Summarization failed: {e}")
-            return {
-                'summary': "Error generating summary",
-                'summary_type': summary_type,
-                'original_length': len(text),
-                'summary_length': 0,
-                'compression_ratio': 0,
-                'key_points': []
+            return self._empty_summary_data(summary_type, text)
+    
+    def batch_summarize(self, documents: Dict[str, str], summary_type: str = "comprehensive",
+                        tier: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Summarize many documents as one Gemini Batch API job, for offline bulk work
+        
+        Batch jobs cost less per token and are not subject to the interactive rate limits,
+        but may take minutes to hours to finish. Documents too long for a single prompt,
+        and every document when google-genai is not installed, are summarized with
+        concurrent regular requests instead.
+        
+        Args:
+            documents: Mapping of document ID to document text
+            summary_type: Type of summary ('comprehensive', 'brief', 'executive')
+            tier: Optional model tier override ('flash' or 'pro')
+            
+        Returns:
+            Mapping of document ID to the summary dictionary returned by summarize_document
+        """
+        client = get_batch_client()
+        batched = {
+            doc_id: text for doc_id, text in documents.items()
+            if client is not None and len(text) <= self.config.MAX_PROMPT_CHARS
+        }
+        
+        results = {}
+        if batched:
+            try:
+                results.update(self._run_summary_batch(client, batched, summary_type, tier))
+            except Exception as e:
+                logger.error(f"Batch summarization failed, falling back to regular requests: {e}")
+        
+        remaining = {doc_id: text for doc_id, text in documents.items() if doc_id not in results}
+        if remaining:
+            results.update(run_coroutine(self._summarize_many_async(remaining, summary_type, tier)))
+        
+        return results
+    
+    def _run_summary_batch(self, client, documents: Dict[str, str], summary_type: str,
+                           tier: Optional[str]) -> Dict[str, Dict[str, Any]]:
+        """Submit one batch job for the documents, wait for it and parse its results file"""
+        requests = io.BytesIO()
+        for doc_id, text in documents.items():
+            request = {
+                'contents': [{'role': 'user', 'parts': [{'text': self._get_summary_prompt(text, summary_type) + _SUMMARY_JSON_INSTRUCTION}]}],
+                'generation_config': {'response_mime_type': 'application/json', 'response_schema': _SUMMARY_SCHEMA}
             }
+            requests.write(json.dumps({'key': doc_id, 'request': request}).encode('utf-8') + b'\n')
+        requests.seek(0)
+        
+        uploaded = client.files.upload(file=requests, config={'mime_type': 'jsonl'})
+        job = client.batches.create(model=self._summary_model(summary_type, tier).model_name, src=uploaded.name)
+        logger.info("Submitted batch summarization job %s for %s documents", job.name, len(documents))
+        
+        deadline = time.monotonic() + self.config.BATCH_TIMEOUT_SECONDS
+        while job.state.name not in _BATCH_FINAL_STATES:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Batch job {job.name} did not finish in time")
+            time.sleep(self.config.BATCH_POLL_INTERVAL_SECONDS)
+            job = client.batches.get(name=job.name)
+        
+        if job.state.name != 'JOB_STATE_SUCCEEDED':
+            raise Exception(f"Batch job {job.name} ended in state {job.state.name}")
+        
+        results = {}
+        for line in client.files.download(file=job.dest.file_name).splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            try:
+                parts = item['response']['candidates'][0]['content']['parts']
+            except (KeyError, IndexError):
+                # Failed requests are left out and retried through the regular path
+                logger.error(f"Batch summary for '{item.get('key')}' failed: {item.get('error')}")
+                continue
+            doc_id = item['key']
+            summary = json.loads(''.join(part.get('text', '') for part in parts))
+            results[doc_id] = self.build_summary_data(
+                summary['summary'], summary_type, documents[doc_id], summary.get('key_points')
+            )
+        
+        logger.info("Batch job %s summarized %s documents", job.name, len(results))
+        return results
     
-    def _get_summary_prompt(self, text: str, summary_type: str) -> str:
-        """Get appropriate prompt based on summary type"""
+    async def _summarize_many_async(self, documents: Dict[str, str], summary_type: str,
+                                    tier: Optional[str]) -> Dict[str, Dict[str, Any]]:
+        """Summarize documents concurrently with regular requests"""
+        semaphore = asyncio.Semaphore(self.config.MAX_CONCURRENT_REQUESTS)
         
-        base_prompt = """
-        You are an expert legal analyst. Analyze the following legal document and provide a summary.
+        async def _summarize(text: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.summarize_document_async(text, summary_type, tier)
         
-        Document text:
-        {text}
+        summaries = await asyncio.gather(*[_summarize(text) for text in documents.values()])
+        return dict(zip(documents.keys(), summaries))
+    
+    async def _summarize_chunks_async(self, text: str) -> str:
         """
+        Map step of the map-reduce summary: brief summaries of each chunk, joined in order
         
-        if summary_type == "brief":
-            specific_instruction = """
-            Provide a brief summary (2-3 paragraphs) focusing on:
-            1. Document type and purpose
-            2. Main parties involved
-            3. Key obligations and terms
-            """
+        Chunks are smaller than a full prompt so more of them are summarized in parallel.
+        If the joined summaries are still too long for the reduce prompt, they are
+        summarized again the same way.
+        """
+        # Bounded so very long documents don't exceed the Gemini rate limit
+        semaphore = asyncio.Semaphore(self.config.MAX_CONCURRENT_REQUESTS)
         
-        elif summary_type == "executive":
-            specific_instruction = """
-            Provide an executive summary (1 paragraph) highlighting:
-            1. Document essence in business terms
-            2. Critical legal implications
-            3. Key decision points
-            """
+        async def _summarize_chunk(chunk: str):
+            async with semaphore:
+                return await generate_text_async(self.flash_model, self._get_summary_prompt(chunk, "brief"))
         
-        else:  # comprehensive
-            specific_instruction = """
-            Provide a comprehensive summary including:
-            1. Document type, purpose, and context
-            2. All parties involved and their roles
-            3. Key provisions, clauses, and obligations
-            4. Important dates, deadlines, and milestones
-            5. Financial terms and considerations
-            6. Legal implications and potential risks
-            7. Compliance requirements
-            8. Termination and dispute resolution clauses
-            """
+        while True:
+            chunks = chunk_text(text, self.config.SUMMARY_CHUNK_CHARS, self.config.CHUNK_OVERLAP_CHARS)
+            logger.info("Summarizing %s document chunks", len(chunks))
+            
+            response_texts = await asyncio.gather(*[_summarize_chunk(chunk) for chunk in chunks])
+            
+            summaries = "\n\n".join(
+                f"Summary of part {i} of {len(chunks)}:\n{response_text}"
+                for i, response_text in enumerate(response_texts, start=1)
+            )
+            # Stop once the summaries fit, or if another round would not shorten them
+            if len(summaries) <= self.config.MAX_PROMPT_CHARS or len(summaries) >= len(text):
+                return summaries
+            text = summaries
+    
+    def _summary_model(self, summary_type: str, tier: Optional[str] = None):
+        """Use flash model for brief summaries, regular model for comprehensive"""
+        return self._select_model(tier, self.flash_model if summary_type == "brief" else self.model)
+    
+    def _select_model(self, tier: Optional[str], default):
+        """Pick the model for an explicit 'flash'/'pro' tier, or fall back to the default"""
+        if tier == 'flash':
+            return self.flash_model
+        if tier == 'pro':
+            return self.model
+        return default
+    
+    def _generate_json(self, model, prompt: str, schema: Dict[str, Any], cached_model=None) -> Any:
+        """Request a reply matching the JSON schema and decode it"""
+        if cached_model is not None:
+            response_text = cached_model.generate_content(
+                prompt, generation_config=genai.GenerationConfig(response_mime_type="application/json", response_schema=schema)
+            ).text
+        else:
+            # Shared schema-bound model, so repeated requests for a document are served from the response cache
+            response_text = generate_text(get_generative_model(model.model_name, None, schema), prompt)
+        return json.loads(response_text)
+    
+    async def _generate_json_async(self, model, prompt: str, schema: Dict[str, Any]) -> Any:
+        """Request a reply matching the JSON schema and decode it, without blocking the event loop"""
+        return json.loads(await generate_text_async(get_generative_model(model.model_name, None, schema), prompt))
+    
+    def build_summary_data(self, summary_text: str, summary_type: str, text: str,
+                           key_points: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Build the summary dictionary from the model response
         
-        return base_prompt.format(text=text) + "\n" + specific_instruction
+        Args:
+            summary_text: Summary returned by the model, e.g. the joined chunks of a streamed summary
+            summary_type: Type of summary
+            text: The summarized document text
+            key_points: Key points returned with the summary; only free-text summaries are scanned for them
+            
+        Returns:
+            Dictionary containing summary and metadata
+        """
+        if key_points is None:
+            key_points = self._extract_key_points(summary_text)
+        
+        return {
+            'summary': summary_text,
+            'summary_type': summary_type,
+            'original_length': len(text),
+            'summary_length': len(summary_text),
+            'compression_ratio': len(summary_text) / len(text) if len(text) > 0 else 0,
+            'key_points': key_points[:10]
+        }
+    
+    def _empty_summary_data(self, summary_type: str, text: str) -> Dict[str, Any]:
+        """Summary dictionary returned when summarization fails"""
+        return {
+            'summary': "Error generating summary",
+            'summary_type': summary_type,
+            'original_length': len(text),
+            'summary_length': 0,
+            'compression_ratio': 0,
+            'key_points': [],
+            'error': 'Summary generation failed'
+        }
+    
+    def _get_summary_prompt(self, text: str, summary_type: str) -> str:
+        """Get appropriate prompt based on summary type; unknown types get the comprehensive prompt"""
+        return _SUMMARY_PROMPT_PREFIXES.get(summary_type, _SUMMARY_PROMPT_PREFIXES['comprehensive']) + text
     
-    def generate_bullet_points(self, text: str) -> List[str]:
+    def generate_bullet_points(self, text: str, tier: Optional[str] = None, cached_model=None) -> List[str]:
         """
         Generate bullet point summary of key legal provisions
         
         Args:
             text: The document text
+            tier: Optional model tier override ('flash' or 'pro')
+            cached_model: Optional model bound to a context cache holding the document
             
         Returns:
             List of bullet points
         """
         try:
-            prompt = f"""
-            Extract the most important legal provisions from this document as concise bullet points.
-            Focus on actionable items, obligations, rights, and critical terms.
+            document_text = self.config.CACHED_DOCUMENT_PLACEHOLDER if cached_model is not None else text
+            bullet_points = self._generate_json(
+                self._select_model(tier, self.flash_model), self._get_bullet_points_prompt(document_text),
+                _STRING_LIST, cached_model
+            )
+            return self._build_bullet_points(bullet_points)
             
-            Document text: {text}
-            
-            Return as a numbered list of bullet points.
-            """
-            
-            response = self.flash_model.generate_content(prompt)
-            
-            # Parse bullet points
-            bullet_points = []
-            for line in response.text.split('\n'):
-                line = line.strip()
-                if line and (line.startswith('•') or line.startswith('-') or line.startswith('*') or any(line.startswith(f"{i}.") for i in range(1, 100))):
-                    bullet_points.append(line)
+        except Exception as e:
+            logger.error(f"Bullet point generation failed: {e}")
+            return []
+    
+    async def generate_bullet_points_async(self, text: str, tier: Optional[str] = None) -> List[str]:
+        """
+        Generate bullet point summary without blocking the event loop
+        
+        Args:
+            text: The document text
+            tier: Optional model tier override ('flash' or 'pro')
             
-            return bullet_points
+        Returns:
+            List of bullet points
+        """
+        try:
+            bullet_points = await self._generate_json_async(
+                self._select_model(tier, self.flash_model), self._get_bullet_points_prompt(text), _STRING_LIST
+            )
+            return self._build_bullet_points(bullet_points)
             
         except Exception as e:
             logger.error(f"Bullet point generation failed: {e}")
             return []
     
-    def analyze_legal_risks(self, text: str) -> Dict[str, Any]:
+    def _get_bullet_points_prompt(self, text: str) -> str:
+        """Get the prompt for bullet point generation"""
+        return (
+            "List the key legal provisions of this document as a JSON array of concise bullet points "
+            "(obligations, rights, actionable items, critical terms).\n\n"
+            f"Document:\n{text}"
+        )
+    
+    def _build_bullet_points(self, bullet_points: List[str]) -> List[str]:
+        """Format the bullet points of a JSON reply"""
+        return [f"• {point}" for point in bullet_points]
+    
+    def analyze_legal_risks(self, text: str, tier: Optional[str] = None, cached_model=None) -> Dict[str, Any]:
         """
         Analyze potential legal risks in the document
         
         Args:
             text: The document text
+            tier: Optional model tier override ('flash' or 'pro')
+            cached_model: Optional model bound to a context cache holding the document
             
         Returns:
             Dictionary containing risk analysis
         """
         try:
-            prompt = f"""
-            As a legal expert, analyze this document for potential legal risks and concerns.
-            
-            Document text: {text}
-            
-            Provide analysis in the following format:
+            document_text = self.config.CACHED_DOCUMENT_PLACEHOLDER if cached_model is not None else text
+            risks = self._generate_json(
+                self._select_model(tier, self.model), self._get_risk_analysis_prompt(document_text),
+                _RISK_ANALYSIS_SCHEMA, cached_model
+            )
+            return {**self._empty_risk_analysis(), **risks}
             
-            HIGH RISK AREAS:
-            - [List high-risk provisions or clauses]
-            
-            MEDIUM RISK AREAS:
-            - [List medium-risk provisions]
-            
-            RECOMMENDATIONS:
-            - [List recommended actions or considerations]
+        except Exception as e:
+            logger.error(f"Risk analysis failed: {e}")
+            return {**self._empty_risk_analysis(), 'error': str(e)}
+    
+    async def analyze_legal_risks_async(self, text: str, tier: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Analyze potential legal risks without blocking the event loop
+        
+        Args:
+            text: The document text
+            tier: Optional model tier override ('flash' or 'pro')
             
-            COMPLIANCE NOTES:
-            - [List any compliance requirements or regulatory considerations]
-            """
+        Returns:
+            Dictionary containing risk analysis
+        """
+        try:
+            risks = await self._generate_json_async(
+                self._select_model(tier, self.model), self._get_risk_analysis_prompt(text), _RISK_ANALYSIS_SCHEMA
+            )
+            return {**self._empty_risk_analysis(), **risks}
             
-            response = self.model.generate_content(prompt)
+        except Exception as e:
+            logger.error(f"Risk analysis failed: {e}")
+            return {**self._empty_risk_analysis(), 'error': str(e)}
+    
+    def _get_risk_analysis_prompt(self, text: str) -> str:
+        """Get the prompt for legal risk analysis"""
+        return (
+            "Legal expert. Analyze this document's legal risks. Return JSON lists: high_risks, medium_risks, "
+            "recommendations, compliance_notes.\n\n"
+            f"Document:\n{text}"
+        )
+    
+    def _empty_risk_analysis(self) -> Dict[str, Any]:
+        """Risk analysis returned when the analysis fails"""
+        return {
+            'high_risks': [],
+            'medium_risks': [],
+            'recommendations': [],
+            'compliance_notes': []
+        }
+    
+    def summarize_with_bullets_and_risks(self, text: str, summary_type: str = "comprehensive", tier: Optional[str] = None,
+                                         cached_model=None) -> Dict[str, Any]:
+        """
+        Generate the summary, bullet points and risk analysis with a single request
+        
+        Args:
+            text: The document text
+            summary_type: Type of summary ('comprehensive', 'brief', 'executive')
+            tier: Optional model tier override ('flash' or 'pro')
+            cached_model: Optional model bound to a context cache holding the document
             
-            # Parse the response
-            analysis = self._parse_risk_analysis(response.text)
+        Returns:
+            Dictionary with 'summary', 'bullet_points' and 'risk_analysis' in the shapes
+            returned by summarize_document, generate_bullet_points and analyze_legal_risks
+        """
+        document_text = self.config.CACHED_DOCUMENT_PLACEHOLDER if cached_model is not None else text
+        prompt = (
+            f"{self._get_summary_prompt(document_text, summary_type)}\n\n"
+            "Return JSON: summary (as above); bullet_points (key provisions: obligations, rights, actionable items, "
+            "critical terms); risks (high risks, medium risks, recommendations, compliance notes)."
+        )
+        
+        try:
+            combined = self._generate_json(self._summary_model(summary_type, tier), prompt, _SUMMARY_BUNDLE_SCHEMA, cached_model)
             
-            return analysis
+            logger.info("Successfully generated %s summary, bullet points and risk analysis", summary_type)
+            return {
+                # The bullet points are the document's key points, as in the fused document processor
+                'summary': self.build_summary_data(
+                    combined.get('summary', ''), summary_type, text, combined.get('bullet_points', [])
+                ),
+                'bullet_points': self._build_bullet_points(combined.get('bullet_points', [])),
+                'risk_analysis': {**self._empty_risk_analysis(), **combined.get('risks', {})}
+            }
             
         except Exception as e:
-            logger.error(f"Risk analysis failed: {e}")
+            logger.error(f"Combined summary and risk analysis failed: {e}")
             return {
-                'high_risks': [],
-                'medium_risks': [],
-                'recommendations': [],
-                'compliance_notes': []
+                'summary': self._empty_summary_data(summary_type, text),
+                'bullet_points': [],
+                'risk_analysis': {**self._empty_risk_analysis(), 'error': str(e)}
             }
     
     def compare_documents(self, text1: str, text2: str, doc1_name: str = "Document 1", doc2_name: str = "Document 2") -> Dict[str, Any]:
@@ -200,94 +553,79 @@ class GeminiSummarizer:
             Dictionary containing comparison analysis
         """
         try:
-            prompt = f"""
-            Compare these two legal documents and provide a detailed analysis of their differences:
+            if len(text1) + len(text2) > self.config.MAX_PROMPT_CHARS:
+                text1, text2 = run_coroutine(self._condense_for_comparison_async(text1, text2))
             
-            {doc1_name}:
-            {text1}
+            response = self.model.generate_content(self._get_comparison_prompt(text1, text2, doc1_name, doc2_name))
             
-            {doc2_name}:
-            {text2}
+            return self._build_comparison_data(response.text, doc1_name, doc2_name)
             
-            Provide analysis in the following format:
-            
-            KEY DIFFERENCES:
-            - [List major differences between documents]
-            
-            SIMILAR PROVISIONS:
-            - [List similar or identical provisions]
-            
-            UNIQUE TO {doc1_name.upper()}:
-            - [List provisions only in document 1]
-            
-            UNIQUE TO {doc2_name.upper()}:
-            - [List provisions only in document 2]
+        except Exception as e:
+            logger.error(f"Document comparison failed: {e}")
+            return self._build_comparison_data("Error comparing documents", doc1_name, doc2_name)
+    
+    async def compare_documents_async(self, text1: str, text2: str, doc1_name: str = "Document 1",
+                                      doc2_name: str = "Document 2") -> Dict[str, Any]:
+        """
+        Compare two legal documents without blocking the event loop
+        
+        Args:
+            text1: First document text
+            text2: Second document text
+            doc1_name: Name of first document
+            doc2_name: Name of second document
             
-            RECOMMENDATIONS:
-            - [Recommendations based on the comparison]
-            """
+        Returns:
+            Dictionary containing comparison analysis
+        """
+        try:
+            if len(text1) + len(text2) > self.config.MAX_PROMPT_CHARS:
+                text1, text2 = await self._condense_for_comparison_async(text1, text2)
             
-            response = self.model.generate_content(prompt)
+            response = await self.model.generate_content_async(
+                self._get_comparison_prompt(text1, text2, doc1_name, doc2_name)
+            )
             
-            return {
-                'comparison_text': response.text,
-                'doc1_name': doc1_name,
-                'doc2_name': doc2_name,
-                'analysis_date': self._get_current_timestamp()
-            }
+            return self._build_comparison_data(response.text, doc1_name, doc2_name)
             
         except Exception as e:
             logger.error(f"Document comparison failed: {e}")
-            return {
-                'comparison_text': "Error comparing documents",
-                'doc1_name': doc1_name,
-                'doc2_name': doc2_name,
-                'analysis_date': self._get_current_timestamp()
-            }
+            return self._build_comparison_data("Error comparing documents", doc1_name, doc2_name)
     
-    def _extract_key_points(self, summary_text: str) -> List[str]:
-        """Extract key points from summary text"""
-        key_points = []
-        lines = summary_text.split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            # Look for numbered points, bullet points, or lines that start with key indicators
-            if (line.startswith(('1.', '2.', '3.', '4.', '5.', '•', '-', '*')) or 
-                'key' in line.lower() or 'important' in line.lower() or 'critical' in line.lower()):
-                if len(line) > 10:  # Avoid very short lines
-                    key_points.append(line)
-        
-        return key_points[:10]  # Limit to top 10 key points
+    async def _condense_for_comparison_async(self, text1: str, text2: str) -> Tuple[str, str]:
+        """Summarize both documents concurrently when together they don't fit in one prompt"""
+        logger.info("Documents are too long to compare directly; summarizing both first")
+        summaries = await asyncio.gather(
+            self.summarize_document_async(text1, "comprehensive"),
+            self.summarize_document_async(text2, "comprehensive")
+        )
+        return tuple(summary['summary'] for summary in summaries)
     
-    def _parse_risk_analysis(self, analysis_text: str) -> Dict[str, Any]:
-        """Parse risk analysis response into structured format"""
-        analysis = {
-            'high_risks': [],
-            'medium_risks': [],
-            'recommendations': [],
-            'compliance_notes': []
+    def _get_comparison_prompt(self, text1: str, text2: str, doc1_name: str, doc2_name: str) -> str:
+        """Get the prompt for document comparison"""
+        return (
+            "Compare these two legal documents. Answer under these headings, one '- ' item per line:\n"
+            f"KEY DIFFERENCES:\nSIMILAR PROVISIONS:\nUNIQUE TO {doc1_name.upper()}:\nUNIQUE TO {doc2_name.upper()}:\n"
+            "RECOMMENDATIONS:\n\n"
+            f"{doc1_name}:\n{text1}\n\n{doc2_name}:\n{text2}"
+        )
+    
+    def _build_comparison_data(self, comparison_text: str, doc1_name: str, doc2_name: str) -> Dict[str, Any]:
+        """Build the comparison dictionary"""
+        return {
+            'comparison_text': comparison_text,
+            'doc1_name': doc1_name,
+            'doc2_name': doc2_name,
+            'analysis_date': self._get_current_timestamp()
         }
+    
+    def _extract_key_points(self, summary_text: str) -> List[str]:
+        """Extract key points from free-text summary text, i.e. streamed summaries"""
+        # Look for numbered points, bullet points, or lines mentioning key indicators
+        key_points = (match.group(1).strip() for match in _KEY_POINT_RE.finditer(summary_text))
         
-        current_section = None
-        lines = analysis_text.split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            
-            # Identify sections
-            if 'HIGH RISK' in line.upper():
-                current_section = 'high_risks'
-            elif 'MEDIUM RISK' in line.upper():
-                current_section = 'medium_risks'
-            elif 'RECOMMENDATIONS' in line.upper():
-                current_section = 'recommendations'
-            elif 'COMPLIANCE' in line.upper():
-                current_section = 'compliance_notes'
-            elif line.startswith('-') and current_section:
-                analysis[current_section].append(line[1:].strip())
-        
-        return analysis
+        # Avoid very short lines; limit to top 10 key points
+        return list(itertools.islice((point for point in key_points if len(point) > 10), 10))
     
     def _get_current_timestamp(self) -> str:
         """Get current timestamp string"""
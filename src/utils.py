@@ -3,17 +3,60 @@ Utility functions for the Legal Document Analysis application
 """
 
 import os
+import functools
+import importlib.util
+import itertools
 import logging
 import hashlib
-from typing import Dict, Any, List, Optional, Union
+import mmap
+from typing import Dict, Any, Iterator, List, Optional, Tuple, Union
 from pathlib import Path
 import json
 from datetime import datetime
 import re
 
-logging.basicConfig(level=logging.INFO)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
 logger = logging.getLogger(__name__)
 
+_WORD_RE = re.compile(r'\S+')
+# Whitespace runs, or single characters that might interfere with processing
+_CLEAN_RE = re.compile(r'\s+|[^\w\s\.,;:!?\-\'\"()[\]{}]')
+# Typographic quotes and backticks map to their plain ASCII quote before cleaning
+_QUOTE_TABLE = str.maketrans({'\u201c': '"', '\u201d': '"', '\u2018': "'", '\u2019': "'", '`': '"'})
+# The ASCII special characters _CLEAN_RE blanks out, plus the backtick quote, as a str.translate table
+_ASCII_CLEAN_TABLE = {
+    **{code: ' ' for code in range(128) if not chr(code).isspace() and _CLEAN_RE.fullmatch(chr(code))},
+    ord('`'): '"'
+}
+_SENTENCE_RE = re.compile(r'[.!?]+')
+_CURRENCY_NUM_RE = re.compile(r'[\d,]+\.?\d*')
+_CURRENCY_SYMBOL_RE = re.compile(r'[$€£¥₹]')
+_DATE_PATTERNS = (
+    r'\b\d{1,2}/\d{1,2}/\d{4}\b',  # MM/DD/YYYY
+    r'\b\d{1,2}-\d{1,2}-\d{4}\b',  # MM-DD-YYYY
+    r'\b\d{4}-\d{1,2}-\d{1,2}\b',  # YYYY-MM-DD
+    r'\b(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},?\s+\d{4}\b',
+    r'\b\d{1,2}\s+(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{4}\b'
+)
+# All date formats in one alternation so the text is scanned once, in linear time when RE2 is installed
+_DATES_RE = (re2 or re).compile('(?i)(?:' + ')|(?:'.join(_DATE_PATTERNS) + ')')
+_PATH_SEPARATORS = ('/', os.sep)
+_ENTITY_LINE = "  {0:2d}. {1}"
+
 def validate_file_path(file_path: str) -> bool:
     """
     Validate if a file path exists and is accessible
@@ -25,31 +68,69 @@ def validate_file_path(file_path: str) -> bool:
         True if valid, False otherwise
     """
     try:
-        path = Path(file_path)
-        return path.exists() and path.is_file()
+        # is_file() is False for missing paths, so one stat() call suffices
+        return Path(file_path).is_file()
     except Exception:
         return False
 
 def get_file_hash(file_path: str) -> Optional[str]:
     """
-    Generate MD5 hash of a file for caching purposes
+    Generate a BLAKE3 hash of a file for caching purposes, or BLAKE2b when blake3 is not installed
     
     Args:
         file_path: Path to the file
         
     Returns:
-        MD5 hash string or None if error
+        Hash hex string or None if error
     """
     try:
-        hash_md5 = hashlib.md5()
+        if blake3 is not None:
+            hasher = blake3.blake3()
+            hasher.update_mmap(file_path)
+            return hasher.hexdigest()
+        
         with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+            if hasattr(hashlib, 'file_digest'):
+                return hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=16)).hexdigest()
+            
+            # Hash straight from the page cache; empty files cannot be mapped
+            hasher = hashlib.blake2b(digest_size=16)
+            if os.fstat(f.fileno()).st_size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    hasher.update(mapped)
+            return hasher.hexdigest()
     except Exception as e:
         logger.error(f"Error generating file hash: {e}")
         return None
 
+def count_words(text: str) -> int:
+    """
+    Count whitespace-delimited words without building a list of them
+    
+    Args:
+        text: Text to count
+        
+    Returns:
+        Number of words, matching len(text.split())
+    """
+    return sum(1 for _ in _WORD_RE.finditer(text))
+
+def get_file_extension(file_path: str) -> str:
+    """
+    Get the lowercased extension of a path, including the dot
+    
+    Args:
+        file_path: Path to the file
+        
+    Returns:
+        Extension such as '.pdf', or '' when the file name has none
+    """
+    head, dot, ext = file_path.rpartition('.')
+    # A dot inside a directory name or leading a dotfile name is not an extension
+    if not head or head[-1] in _PATH_SEPARATORS or any(sep in ext for sep in _PATH_SEPARATORS):
+        return ''
+    return dot + ext.lower()
+
 def clean_text(text: str) -> str:
     """
     Clean and normalize text for processing
@@ -63,17 +144,13 @@ def clean_text(text: str) -> str:
     if not text:
         return ""
     
-    # Remove extra whitespace and normalize line breaks
-    text = re.sub(r'\s+', ' ', text)
-    text = text.strip()
+    # ASCII text stays in C string loops: split/join collapses and strips whitespace,
+    # then a translate table normalizes backtick quotes and blanks out special characters
+    if text.isascii():
+        return ' '.join(text.split()).translate(_ASCII_CLEAN_TABLE)
     
-    # Remove special characters that might interfere with processing
-    text = re.sub(r'[^\w\s\.,;:!?\-\'\"()[\]{}]', ' ', text)
-    
-    # Normalize quotes
-    text = re.sub(r'[""''`]', '"', text)
-    
-    return text
+    # Normalize quotes, then collapse whitespace runs and blank out special characters in one pass
+    return _CLEAN_RE.sub(' ', text.strip().translate(_QUOTE_TABLE))
 
 def chunk_text(text: str, max_length: int = 8000, overlap: int = 200) -> List[str]:
     """
@@ -90,26 +167,46 @@ def chunk_text(text: str, max_length: int = 8000, overlap: int = 200) -> List[st
     if len(text) <= max_length:
         return [text]
     
-    chunks = []
+    return [text[start:end] for start, end in chunk_spans(text, max_length, overlap)]
+
+def chunk_spans(text: str, max_length: int = 8000, overlap: int = 200) -> Iterator[Tuple[int, int]]:
+    """
+    Yield the (start, end) offsets of the chunks chunk_text would return, without copying any text
+    
+    Args:
+        text: Text to split
+        max_length: Maximum length per chunk
+        overlap: Overlap between chunks
+        
+    Yields:
+        Offsets of each non-blank chunk, with surrounding whitespace excluded
+    """
+    text_length = len(text)
     start = 0
     
-    while start < len(text):
+    while start < text_length:
         end = start + max_length
         
-        # Try to break at sentence boundary
-        if end < len(text):
-            # Look for sentence ending within the last 200 characters
+        # Try to break at a paragraph boundary, then at a sentence boundary
+        if end < text_length:
+            paragraph_end = text.rfind('\n\n', start, end)
             sentence_end = text.rfind('.', start, end)
-            if sentence_end > start + max_length - 200:
+            if paragraph_end > start + max_length // 2:
+                end = paragraph_end + 2
+            # Look for sentence ending within the last 200 characters
+            elif sentence_end > start + max_length - 200:
                 end = sentence_end + 1
         
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(chunk)
+        # Trim whitespace by moving the offsets instead of slicing and stripping
+        chunk_start, chunk_end = start, min(end, text_length)
+        while chunk_start < chunk_end and text[chunk_start].isspace():
+            chunk_start += 1
+        while chunk_end > chunk_start and text[chunk_end - 1].isspace():
+            chunk_end -= 1
+        if chunk_start < chunk_end:
+            yield chunk_start, chunk_end
         
         start = max(end - overlap, start + 1)  # Prevent infinite loop
-    
-    return chunks
 
 def format_currency(amount_str: str) -> Optional[str]:
     """
@@ -123,23 +220,16 @@ def format_currency(amount_str: str) -> Optional[str]:
     """
     try:
         # Extract numeric value
-        numeric = re.findall(r'[\d,]+\.?\d*', amount_str)
+        numeric = _CURRENCY_NUM_RE.search(amount_str)
         if not numeric:
             return None
         
         # Get currency symbol
-        currency_symbols = ['$', '€', '£', '¥', '₹']
-        currency = None
-        for symbol in currency_symbols:
-            if symbol in amount_str:
-                currency = symbol
-                break
-        
-        if not currency:
-            currency = '$'  # Default to dollar
+        symbol = _CURRENCY_SYMBOL_RE.search(amount_str)
+        currency = symbol.group(0) if symbol else '$'  # Default to dollar
         
         # Format the number
-        number = numeric[0].replace(',', '')
+        number = numeric.group(0).replace(',', '')
         if '.' in number:
             formatted = f"{currency}{float(number):,.2f}"
         else:
@@ -158,22 +248,27 @@ def extract_dates(text: str) -> List[str]:
         text: Text to search for dates
         
     Returns:
-        List of found dates
-    """
-    date_patterns = [
-        r'\b\d{1,2}/\d{1,2}/\d{4}\b',  # MM/DD/YYYY
-        r'\b\d{1,2}-\d{1,2}-\d{4}\b',  # MM-DD-YYYY
-        r'\b\d{4}-\d{1,2}-\d{1,2}\b',  # YYYY-MM-DD
-        r'\b(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},?\s+\d{4}\b',
-        r'\b\d{1,2}\s+(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{4}\b'
-    ]
+        List of found dates, in order of first appearance
+    """
+    # Remove duplicates, keeping dates in document order
+    return list(dict.fromkeys(match.group(0) for match in _DATES_RE.finditer(text)))
+
+def results_to_json(results: Dict[str, Any], indent: bool = False) -> bytes:
+    """
+    Serialize analysis results to UTF-8 JSON, using orjson when it is installed
     
-    dates = []
-    for pattern in date_patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        dates.extend(matches)
+    Args:
+        results: Analysis results dictionary
+        indent: Pretty-print with two-space indentation
+        
+    Returns:
+        JSON document as bytes
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(results, option=option, default=str)
     
-    return list(set(dates))  # Remove duplicates
+    return json.dumps(results, indent=2 if indent else None, ensure_ascii=False, default=str).encode('utf-8')
 
 def save_results_to_json(results: Dict[str, Any], file_path: str) -> bool:
     """
@@ -194,10 +289,12 @@ def save_results_to_json(results: Dict[str, Any], file_path: str) -> bool:
             'tool': 'legal_document_analysis_google_genai'
         }
         
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
+        # The stdlib's C encoder only handles compact output, so files are pretty-printed
+        # only when orjson can do it at C speed
+        with open(file_path, 'wb') as f:
+            f.write(results_to_json(results, indent=orjson is not None))
         
-        logger.info(f"Results saved to {file_path}")
+        logger.info("Results saved to %s", file_path)
         return True
         
     except Exception as e:
@@ -206,7 +303,7 @@ def save_results_to_json(results: Dict[str, Any], file_path: str) -> bool:
 
 def load_results_from_json(file_path: str) -> Optional[Dict[str, Any]]:
     """
-    Load analysis results from JSON file
+    Load analysis results from JSON file, using orjson when it is installed
     
     Args:
         file_path: Input file path
@@ -215,10 +312,12 @@ def load_results_from_json(file_path: str) -> Optional[Dict[str, Any]]:
         Results dictionary or None if error
     """
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            results = json.load(f)
+        # Parse the raw bytes in one call; orjson skips the str decode as well
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        results = orjson.loads(data) if orjson is not None else json.loads(data)
         
-        logger.info(f"Results loaded from {file_path}")
+        logger.info("Results loaded from %s", file_path)
         return results
         
     except Exception as e:
@@ -257,8 +356,8 @@ def generate_summary_statistics(results: Dict[str, Any]) -> Dict[str, Any]:
             
             stats['content_stats'] = {
                 'character_count': len(text_content),
-                'word_count': len(text_content.split()),
-                'sentence_count': len(re.findall(r'[.!?]+', text_content)),
+                'word_count': text_data['word_count'] if 'word_count' in text_data else count_words(text_content),
+                'sentence_count': sum(1 for _ in _SENTENCE_RE.finditer(text_content)),
                 'paragraph_count': len([p for p in text_content.split('\n\n') if p.strip()]),
                 'page_count': text_data.get('pages', 0),
                 'confidence': text_data.get('confidence', 0.0)
@@ -270,7 +369,7 @@ def generate_summary_statistics(results: Dict[str, Any]) -> Dict[str, Any]:
             entities = entity_data.get('entities', {})
             
             stats['entity_stats'] = {
-                'total_entities': sum(len(entity_list) for entity_list in entities.values()),
+                'total_entities': entity_data['total_entities'] if 'total_entities' in entity_data else sum(map(len, entities.values())),
                 'categories_found': len(entities),
                 'entities_by_category': {
                     category: len(entity_list) 
@@ -325,19 +424,20 @@ def create_directory_structure(base_path: str) -> bool:
         init_file = base_path / 'src' / '__init__.py'
         init_file.touch(exist_ok=True)
         
-        logger.info(f"Directory structure created at {base_path}")
+        logger.info("Directory structure created at %s", base_path)
         return True
         
     except Exception as e:
         logger.error(f"Error creating directory structure: {e}")
         return False
 
-def format_entity_report(entities: Dict[str, List[str]]) -> str:
+def format_entity_report(entities: Dict[str, List[str]], total_entities: Optional[int] = None) -> str:
     """
     Format entity extraction results as a readable report
     
     Args:
         entities: Dictionary of extracted entities
+        total_entities: Precomputed entity count, e.g. entity_data['total_entities']
         
     Returns:
         Formatted string report
@@ -347,7 +447,8 @@ def format_entity_report(entities: Dict[str, List[str]]) -> str:
     report_lines.append("=" * 50)
     report_lines.append("")
     
-    total_entities = sum(len(entity_list) for entity_list in entities.values())
+    if total_entities is None:
+        total_entities = sum(map(len, entities.values()))
     report_lines.append(f"Total entities found: {total_entities}")
     report_lines.append(f"Categories identified: {len(entities)}")
     report_lines.append("")
@@ -357,8 +458,7 @@ def format_entity_report(entities: Dict[str, List[str]]) -> str:
             report_lines.append(f"{category.replace('_', ' ').upper()} ({len(entity_list)})")
             report_lines.append("-" * 30)
             
-            for i, entity in enumerate(entity_list, 1):
-                report_lines.append(f"  {i:2d}. {entity}")
+            report_lines.extend(map(_ENTITY_LINE.format, itertools.count(1), entity_list))
             
             report_lines.append("")
     
@@ -367,6 +467,20 @@ def format_entity_report(entities: Dict[str, List[str]]) -> str:
     
     return "\n".join(report_lines)
 
+@functools.lru_cache(maxsize=1)
+def _package_availability() -> Dict[str, bool]:
+    """Which optional and required packages are installed, probed once without importing them"""
+    def installed(name: str) -> bool:
+        try:
+            return importlib.util.find_spec(name) is not None
+        except ImportError:
+            return False
+    
+    return {
+        'google_cloud_available': installed('google.cloud.documentai_v1'),
+        'required_packages': all(installed(name) for name in ('google.generativeai', 'streamlit', 'pandas'))
+    }
+
 def validate_environment() -> Dict[str, bool]:
     """
     Validate the environment setup and dependencies
@@ -374,30 +488,8 @@ def validate_environment() -> Dict[str, bool]:
     Returns:
         Dictionary of validation results
     """
-    validation = {
-        'gemini_api_key': False,
-        'google_cloud_available': False,
-        'required_packages': False
-    }
-    
-    # Check Gemini API key
-    if os.getenv('GEMINI_API_KEY'):
-        validation['gemini_api_key'] = True
-    
-    # Check Google Cloud availability
-    try:
-        from google.cloud import documentai_v1
-        validation['google_cloud_available'] = True
-    except ImportError:
-        pass
-    
-    # Check required packages
-    try:
-        import google.generativeai
-        import streamlit
-        import pandas
-        validation['required_packages'] = True
-    except ImportError:
-        pass
-    
-    return validation
\ No newline at end of file
+    # The API key can change between calls; installed packages cannot
+    return {
+        'gemini_api_key': bool(os.getenv('GEMINI_API_KEY')),
+        **_package_availability()
+    }
\ No newline at end of file